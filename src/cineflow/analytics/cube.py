@@ -0,0 +1,115 @@
+"""
+Cubo analítico en memoria para el dashboard: el índice temporal por película
+(analytics.time_index) y las métricas diarias, leídos de Postgres una vez por generación
+del warehouse. Los filtros y rankings se resuelven con numpy sin volver a la base.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from cineflow.analytics.time_index import MovieIndex, top_n
+
+DAILY_SQL = "SELECT * FROM daily_metrics ORDER BY rating_date"
+
+
+@dataclass(frozen=True)
+class Cube:
+    """
+    MovieIndex (ratings por película y día con sumas acumuladas, más títulos y
+    géneros) y daily_metrics. El dashboard agrupa las películas por título: en
+    MovieLens hay títulos repetidos con distinto movieId.
+    """
+
+    generation: int
+    movies: MovieIndex
+    title_codes: np.ndarray  # título de cada película (índice i) como código en `titles`
+    titles: np.ndarray  # títulos distintos, ordenados
+    daily_frame: pd.DataFrame  # daily_metrics ordenada por rating_date
+
+    @classmethod
+    def from_frames(
+        cls,
+        cells: pd.DataFrame,
+        movies: pd.DataFrame,
+        movie_genres: pd.DataFrame,
+        daily: pd.DataFrame,
+        generation: int = 0,
+    ) -> Cube:
+        """
+        `cells`: filas de movie_daily_stats; `movies`: movie_id, title;
+        `movie_genres`: movie_id, genre; `daily`: filas de daily_metrics.
+        """
+        return cls._build(MovieIndex.from_frames(cells, movies, movie_genres, generation), daily)
+
+    @classmethod
+    def _build(cls, index: MovieIndex, daily: pd.DataFrame) -> Cube:
+        title_codes, titles = pd.factorize(index.titles, sort=True)
+        daily = daily.assign(rating_date=pd.to_datetime(daily["rating_date"]).dt.date)
+        return cls(
+            generation=index.generation,
+            movies=index,
+            title_codes=title_codes.astype(np.int64),
+            titles=np.asarray(titles, dtype=object),
+            daily_frame=daily.sort_values("rating_date").reset_index(drop=True),
+        )
+
+    @classmethod
+    def load(cls, conn: Connection) -> Cube:
+        """Lee el cubo en una única instantánea (REPEATABLE READ) de la generación actual."""
+        conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            index = MovieIndex.read(conn)
+            daily = pd.read_sql(text(DAILY_SQL), conn)
+        return cls._build(index, daily)
+
+    @property
+    def nbytes(self) -> int:
+        return self.movies.nbytes + int(self.daily_frame.memory_usage().sum())
+
+    def movie_totals(self, since: Optional[date] = None) -> tuple[np.ndarray, np.ndarray]:
+        """(ratings, suma de ratings) de cada película, desde `since` si se indica."""
+        return self.movies.index.totals(since)
+
+    @staticmethod
+    def _rank(
+        labels: np.ndarray, cnt: np.ndarray, total: np.ndarray, limit: int, min_votes: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # ORDER BY avg_rating DESC, ratings DESC, etiqueta LIMIT `limit` (`labels` va ordenado)
+        top, avg = top_n(cnt, total, limit, min_votes)
+        return labels[top], cnt[top], avg
+
+    def top_movies(self, limit: int, min_votes: int, since: Optional[date] = None) -> pd.DataFrame:
+        """Películas mejor valoradas (agrupadas por título) con al menos `min_votes` ratings."""
+        cnt, total = self.movie_totals(since)
+        n = len(self.titles)
+        t_cnt = np.bincount(self.title_codes, weights=cnt, minlength=n).astype(np.int64)
+        t_total = np.bincount(self.title_codes, weights=total, minlength=n)
+        label, ratings, avg = self._rank(self.titles, t_cnt, t_total, limit, min_votes)
+        return pd.DataFrame({"title": label, "ratings": ratings, "avg_rating": avg})
+
+    def top_genres(self, limit: int, min_votes: int, since: Optional[date] = None) -> pd.DataFrame:
+        """Géneros mejor valorados: cada rating cuenta en todos los géneros de su película."""
+        cnt, total = self.movie_totals(since)
+        m = self.movies
+        n = len(m.genres)
+        g_cnt = np.bincount(m.genre_idx, weights=cnt[m.genre_movie], minlength=n)
+        g_total = np.bincount(m.genre_idx, weights=total[m.genre_movie], minlength=n)
+        label, ratings, avg = self._rank(
+            m.genres, g_cnt.astype(np.int64), g_total, limit, min_votes
+        )
+        return pd.DataFrame({"genre": label, "total_ratings": ratings, "avg_rating": avg})
+
+    def daily(self, since: Optional[date] = None) -> pd.DataFrame:
+        """Métricas diarias desde `since` (corte por búsqueda binaria sobre la fecha)."""
+        if since is None:
+            return self.daily_frame
+        start = int(self.daily_frame["rating_date"].searchsorted(since))
+        return self.daily_frame.iloc[start:]
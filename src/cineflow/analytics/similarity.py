@@ -0,0 +1,184 @@
+"""
+Películas similares (item-item) por coseno ajustado: a cada rating se le resta la
+media de su usuario y se compara cada par de películas por el coseno de sus columnas
+en la matriz dispersa usuario × película. Los K vecinos de cada película se calculan
+por bloques de filas (producto disperso -> bloque denso acotado -> argpartition), así
+que la memoria depende del tamaño del bloque y no del número de pares.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from cineflow.analytics.time_index import MOVIES_SQL, lookup
+from cineflow.storage import etl_state
+
+NEIGHBOURS_SQL = """
+SELECT movie_id, neighbor_id, similarity
+FROM movie_similarity
+ORDER BY movie_id, rank
+"""
+COLUMNS = ["movie_id", "rank", "neighbor_id", "similarity"]
+# Por fila del bloque: similitudes float32 densas, producto disperso intermedio y los
+# índices int64 de argpartition (en bytes por película)
+_BYTES_PER_CELL = 4 + 8 + 8
+
+
+def rating_matrix(
+    users: np.ndarray, movies: np.ndarray, ratings: np.ndarray, min_ratings: int
+) -> tuple[sp.csr_matrix, np.ndarray]:
+    """
+    Matriz película × usuario con los ratings centrados por usuario y cada fila
+    normalizada a norma 1 (su producto es el coseno ajustado). Las películas con
+    menos de `min_ratings` ratings (o sin varianza) quedan a cero. Devuelve también
+    el movie_id de cada fila.
+    """
+    movie_ids, m_idx = np.unique(movies, return_inverse=True)
+    _, u_idx = np.unique(users, return_inverse=True)
+    n_users = int(u_idx.max()) + 1 if len(u_idx) else 0
+    per_user = np.bincount(u_idx, minlength=n_users)
+    mean = np.bincount(u_idx, weights=ratings, minlength=n_users) / np.maximum(per_user, 1)
+    centered = (ratings - mean[u_idx]).astype(np.float32)
+    x = sp.csr_matrix((centered, (m_idx, u_idx)), shape=(len(movie_ids), n_users))
+    x.eliminate_zeros()
+    norms = np.sqrt(np.asarray(x.multiply(x).sum(axis=1)).ravel())
+    keep = (np.bincount(m_idx, minlength=len(movie_ids)) >= min_ratings) & (norms > 0)
+    scale = np.where(keep, 1.0 / np.where(norms > 0, norms, 1.0), 0.0).astype(np.float32)
+    return sp.csr_matrix(sp.diags(scale) @ x), movie_ids
+
+
+def block_rows(n_movies: int, memory_mb: int) -> int:
+    """Filas por bloque para que el bloque denso quepa en `memory_mb`."""
+    return max(1, min(n_movies, (memory_mb << 20) // max(1, n_movies * _BYTES_PER_CELL)))
+
+
+def iter_top_k(
+    x: sp.csr_matrix, k: int, block: int
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    (filas, vecinos, similitudes) por bloque: para cada fila, hasta `k` vecinos con
+    similitud > 0, de mayor a menor (empates por índice). Sin la propia película.
+    """
+    n = x.shape[0]
+    xt = sp.csr_matrix(x.T)
+    k = min(k, n - 1)
+    if k < 1:
+        return
+    for lo in range(0, n, block):
+        hi = min(n, lo + block)
+        sims = (x[lo:hi] @ xt).toarray()
+        sims[np.arange(hi - lo), np.arange(lo, hi)] = -np.inf
+        cand = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        vals = np.take_along_axis(sims, cand, axis=1)
+        order = np.lexsort((cand, -vals), axis=1)
+        cand = np.take_along_axis(cand, order, axis=1)
+        vals = np.take_along_axis(vals, order, axis=1)
+        rows = np.repeat(np.arange(lo, hi), k).reshape(hi - lo, k)
+        ok = vals > 0
+        yield rows[ok], cand[ok], vals[ok]
+
+
+def neighbours_frame(
+    users: np.ndarray,
+    movies: np.ndarray,
+    ratings: np.ndarray,
+    k: int,
+    min_ratings: int,
+    memory_mb: int,
+) -> pd.DataFrame:
+    """Tabla movie_similarity (movie_id, rank, neighbor_id, similarity) de los ratings dados."""
+    x, movie_ids = rating_matrix(users, movies, ratings, min_ratings)
+    parts = list(iter_top_k(x, k, block_rows(len(movie_ids), memory_mb)))
+    if not parts:
+        return pd.DataFrame({c: np.array([], dtype=np.int32) for c in COLUMNS})
+    rows = np.concatenate([p[0] for p in parts])
+    cols = np.concatenate([p[1] for p in parts])
+    sims = np.concatenate([p[2] for p in parts])
+    # rank 1..n dentro de cada película (las filas van ordenadas y agrupadas)
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)])) + 1
+    return pd.DataFrame(
+        {
+            "movie_id": movie_ids[rows].astype(np.int32),
+            "rank": rank.astype(np.int16),
+            "neighbor_id": movie_ids[cols].astype(np.int32),
+            "similarity": np.round(sims, 5).astype(np.float32),
+        }
+    )
+
+
+@dataclass(frozen=True)
+class SimilarityIndex:
+    """
+    Vecinos de movie_similarity en CSR (los de la película `i` de `movie_ids` ocupan
+    [offsets[i], offsets[i+1])) con título y géneros: una búsqueda binaria por consulta.
+    """
+
+    generation: int
+    movie_ids: np.ndarray  # int64, ordenados (dim_movie)
+    titles: np.ndarray
+    genre_labels: np.ndarray
+    offsets: np.ndarray
+    neighbours: np.ndarray  # posición del vecino en `movie_ids`
+    similarity: np.ndarray
+
+    @classmethod
+    def from_frames(
+        cls, movies: pd.DataFrame, neighbours: pd.DataFrame, generation: int = 0
+    ) -> SimilarityIndex:
+        """`movies`: movie_id, title, genres; `neighbours`: movie_id, neighbor_id, similarity."""
+        movies = movies.sort_values("movie_id", kind="stable")
+        movie_ids = movies["movie_id"].to_numpy(np.int64)
+        src, src_ok = lookup(movie_ids, neighbours["movie_id"].to_numpy(np.int64))
+        dst, dst_ok = lookup(movie_ids, neighbours["neighbor_id"].to_numpy(np.int64))
+        ok = src_ok & dst_ok
+        sort = np.argsort(src[ok], kind="stable")  # conserva el orden por rank
+        src = src[ok][sort]
+        return cls(
+            generation=generation,
+            movie_ids=movie_ids,
+            titles=movies["title"].to_numpy(object),
+            genre_labels=movies["genres"].to_numpy(object),
+            offsets=np.searchsorted(src, np.arange(len(movie_ids) + 1)).astype(np.int64),
+            neighbours=dst[ok][sort],
+            similarity=neighbours["similarity"].to_numpy(np.float32)[ok][sort],
+        )
+
+    @classmethod
+    def load(cls, conn: Connection) -> SimilarityIndex:
+        """Lee vecinos y catálogo en una única instantánea (REPEATABLE READ)."""
+        conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            generation = etl_state.get_generation(conn)
+            movies = pd.read_sql(text(MOVIES_SQL), conn)
+            neighbours = pd.read_sql(text(NEIGHBOURS_SQL), conn)
+        return cls.from_frames(movies, neighbours, generation)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.movie_ids, self.offsets, self.neighbours, self.similarity)
+        return sum(int(a.nbytes) for a in arrays)
+
+    def similar(self, movie_id: int, limit: int) -> list[dict[str, object]] | None:
+        """Hasta `limit` películas más parecidas a `movie_id`; None si no está en dim_movie."""
+        i = int(np.searchsorted(self.movie_ids, movie_id))
+        if i == len(self.movie_ids) or self.movie_ids[i] != movie_id:
+            return None
+        lo = int(self.offsets[i])
+        hi = min(int(self.offsets[i + 1]), lo + limit)
+        return [
+            {
+                "movie_id": int(self.movie_ids[j]),
+                "title": self.titles[j],
+                "genres": self.genre_labels[j],
+                "similarity": round(float(s), 4),
+            }
+            for j, s in zip(self.neighbours[lo:hi], self.similarity[lo:hi])
+        ]
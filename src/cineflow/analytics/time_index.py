@@ -0,0 +1,234 @@
+"""
+Índice temporal por película: recuentos y sumas de ratings por día (movie_daily_stats)
+en arrays CSR con sumas acumuladas. Cualquier ventana [since, until] se resuelve con
+dos búsquedas binarias por película y el top-N con una selección parcial, así que el
+coste depende del número de películas y no del tamaño de la ventana.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from cineflow.storage import etl_state
+
+CELLS_SQL = """
+SELECT movie_id, rating_date, ratings, rating_sum
+FROM movie_daily_stats
+ORDER BY movie_id, rating_date
+"""
+MOVIES_SQL = "SELECT movie_id, title, genres FROM dim_movie ORDER BY movie_id"
+GENRES_SQL = """
+SELECT b.movie_id, g.name AS genre
+FROM bridge_movie_genre b
+JOIN dim_genre g ON g.genre_id = b.genre_id
+"""
+
+_DAY0 = 1 << 31  # desplaza los días (desde 1970, con signo) al rango positivo de 32 bits
+
+
+def _day(d: date) -> int:
+    return int(np.datetime64(d, "D").astype(np.int64))
+
+
+def lookup(sorted_ids: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Posición de cada `values` en `sorted_ids` y máscara de los que aparecen."""
+    if not len(sorted_ids):
+        return np.zeros(len(values), dtype=np.int64), np.zeros(len(values), dtype=bool)
+    idx = np.minimum(np.searchsorted(sorted_ids, values), len(sorted_ids) - 1)
+    return idx.astype(np.int64), sorted_ids[idx] == values
+
+
+def round2(x: np.ndarray) -> np.ndarray:
+    # Como ROUND(numeric, 2) de Postgres: los empates se alejan de cero (valores >= 0)
+    return np.floor(x * 100 + 0.5) / 100
+
+
+def top_n(
+    cnt: np.ndarray,
+    total: np.ndarray,
+    limit: int,
+    min_votes: int,
+    mask: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Posiciones y medias (redondeadas a 2 decimales) del top-`limit` por
+    avg_rating DESC, ratings DESC, posición ASC entre las que tienen al menos
+    `min_votes` ratings (y `mask`, si se indica). argpartition deja los candidatos
+    en O(n); solo se ordenan los que empatan con el último.
+    """
+    ok = cnt >= max(min_votes, 1)
+    if mask is not None:
+        ok &= mask
+    keep = np.flatnonzero(ok)
+    avg = round2(total[keep] / cnt[keep])
+    # Una sola clave entera: centésimas de media en los bits altos, ratings en los bajos
+    score = (np.rint(avg * 100).astype(np.int64) << 40) | cnt[keep].astype(np.int64)
+    if len(keep) > limit > 0:
+        kth = len(keep) - limit
+        cut = score[np.argpartition(score, kth)[kth]]
+        sel = np.flatnonzero(score >= cut)
+    else:
+        sel = np.arange(len(keep))
+    top = sel[np.lexsort((keep[sel], -score[sel]))][:limit]
+    return keep[top], avg[top]
+
+
+@dataclass(frozen=True)
+class TimeIndex:
+    """
+    Celdas (película, día) en formato CSR: las de la película `i` ocupan
+    [offsets[i], offsets[i+1]) ordenadas por día. `keys` = (i << 32) | día permite
+    localizar los límites de la ventana de todas las películas con un único
+    searchsorted vectorizado, y las sumas acumuladas dan el total del tramo en O(1).
+    """
+
+    offsets: np.ndarray  # int64, n_películas + 1
+    keys: np.ndarray  # int64, una por celda
+    cum_cnt: np.ndarray  # int64, n_celdas + 1 (cum_cnt[0] = 0)
+    cum_sum: np.ndarray  # float64, n_celdas + 1
+
+    @classmethod
+    def from_cells(cls, movie_ids: np.ndarray, cells: pd.DataFrame) -> TimeIndex:
+        """
+        `movie_ids`: ids ordenados (la posición es el índice de película);
+        `cells`: movie_id, rating_date, ratings, rating_sum. Las celdas de películas
+        que no están en `movie_ids` se descartan (como el JOIN con dim_movie en SQL).
+        """
+        idx, known = lookup(movie_ids, cells["movie_id"].to_numpy(np.int64))
+        days = pd.to_datetime(cells["rating_date"]).to_numpy("datetime64[D]").astype(np.int64)
+        keys = ((idx << 32) | (days + _DAY0))[known]
+        cnt = cells["ratings"].to_numpy(np.int64)[known]
+        total = cells["rating_sum"].to_numpy(np.float64)[known]
+        sort = np.argsort(keys, kind="stable")
+        keys, cnt, total = keys[sort], cnt[sort], total[sort]
+        offsets = np.searchsorted(keys >> 32, np.arange(len(movie_ids) + 1))
+        return cls(
+            offsets=offsets.astype(np.int64),
+            keys=keys,
+            cum_cnt=np.concatenate([[0], np.cumsum(cnt)]).astype(np.int64),
+            cum_sum=np.concatenate([[0.0], np.cumsum(total)]),
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(a.nbytes) for a in (self.offsets, self.keys, self.cum_cnt, self.cum_sum))
+
+    def totals(
+        self, since: Optional[date] = None, until: Optional[date] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(ratings, suma de ratings) de cada película entre `since` y `until` (incluidos)."""
+        movies = np.arange(len(self.offsets) - 1, dtype=np.int64) << 32
+        if since is None:
+            start = self.offsets[:-1]
+        else:
+            start = np.searchsorted(self.keys, movies | (_day(since) + _DAY0))
+        if until is None:
+            end = self.offsets[1:]
+        else:
+            end = np.searchsorted(self.keys, movies | (_day(until) + 1 + _DAY0))
+        end = np.maximum(start, end)  # until < since: ventana vacía
+        return self.cum_cnt[end] - self.cum_cnt[start], self.cum_sum[end] - self.cum_sum[start]
+
+
+@dataclass(frozen=True)
+class MovieIndex:
+    """TimeIndex con el catálogo (título y géneros de dim_movie) y el bridge de géneros."""
+
+    generation: int
+    movie_ids: np.ndarray  # int64, ordenados: posición = índice de película
+    titles: np.ndarray
+    genre_labels: np.ndarray  # dim_movie.genres ("Comedy|Drama")
+    index: TimeIndex
+    genre_movie: np.ndarray  # pares (película, género) del bridge
+    genre_idx: np.ndarray
+    genres: np.ndarray  # nombre de cada género, ordenados
+
+    @classmethod
+    def from_frames(
+        cls,
+        cells: pd.DataFrame,
+        movies: pd.DataFrame,
+        movie_genres: pd.DataFrame,
+        generation: int = 0,
+    ) -> MovieIndex:
+        """
+        `cells`: filas de movie_daily_stats; `movies`: movie_id, title y (opcional)
+        genres; `movie_genres`: movie_id, genre.
+        """
+        movie_ids = movies["movie_id"].to_numpy(np.int64)
+        order = np.argsort(movie_ids, kind="stable")
+        movie_ids = movie_ids[order]
+        labels = movies["genres"] if "genres" in movies else pd.Series("", index=movies.index)
+        g_idx, g_known = lookup(movie_ids, movie_genres["movie_id"].to_numpy(np.int64))
+        genre_codes, genres = pd.factorize(movie_genres["genre"], sort=True)
+        return cls(
+            generation=generation,
+            movie_ids=movie_ids,
+            titles=movies["title"].to_numpy(object)[order],
+            genre_labels=labels.to_numpy(object)[order],
+            index=TimeIndex.from_cells(movie_ids, cells),
+            genre_movie=g_idx[g_known],
+            genre_idx=genre_codes[g_known].astype(np.int64),
+            genres=np.asarray(genres, dtype=object),
+        )
+
+    @classmethod
+    def read(cls, conn: Connection) -> MovieIndex:
+        """Lee el índice dentro de la transacción de `conn` (la instantánea la fija quien llama)."""
+        generation = etl_state.get_generation(conn)
+        cells = pd.read_sql(text(CELLS_SQL), conn)
+        movies = pd.read_sql(text(MOVIES_SQL), conn)
+        movie_genres = pd.read_sql(text(GENRES_SQL), conn)
+        return cls.from_frames(cells, movies, movie_genres, generation)
+
+    @classmethod
+    def load(cls, conn: Connection) -> MovieIndex:
+        """Lee el índice en una única instantánea (REPEATABLE READ) de la generación actual."""
+        conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            return cls.read(conn)
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes + int(self.movie_ids.nbytes + self.genre_movie.nbytes)
+
+    def genre_mask(self, genre: str) -> np.ndarray:
+        """Películas del género `genre` (sin distinguir mayúsculas); ninguna si no existe."""
+        mask = np.zeros(len(self.movie_ids), dtype=bool)
+        codes = np.flatnonzero(pd.Series(self.genres).str.lower() == genre.lower())
+        mask[self.genre_movie[np.isin(self.genre_idx, codes)]] = True
+        return mask
+
+    def top_movies(
+        self,
+        limit: int,
+        min_votes: int,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        genre: Optional[str] = None,
+    ) -> list[dict[str, object]]:
+        """
+        Películas mejor valoradas en [since, until], con las columnas y tipos de
+        /movies/top (avg_rating como Decimal de 2 decimales, igual que NUMERIC(6, 2)).
+        """
+        cnt, total = self.index.totals(since, until)
+        mask = None if genre is None else self.genre_mask(genre)
+        idx, avg = top_n(cnt, total, limit, min_votes, mask)
+        return [
+            {
+                "movie_id": int(self.movie_ids[i]),
+                "title": self.titles[i],
+                "genres": self.genre_labels[i],
+                "ratings": int(cnt[i]),
+                "avg_rating": Decimal(f"{a:.2f}"),
+            }
+            for i, a in zip(idx, avg)
+        ]
@@ -0,0 +1,214 @@
+"""Caché de respuestas de la API invalidada por la generación del warehouse."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Generic, Hashable, Iterable, TypeVar
+
+import asyncpg
+from sqlalchemy import text
+
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_async import get_async_engine
+from cineflow.storage.postgres_client import database_url
+
+T = TypeVar("T")
+
+
+class ResponseCache:
+    """
+    LRU acotado por `maxsize` entradas y `ttl_s` segundos. Cada entrada guarda la
+    generación del warehouse con la que se calculó: si la generación cambió, la
+    entrada ya no sirve aunque no haya caducado.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float) -> None:
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[int, float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, generation: int) -> Any | None:
+        entry = self._data.get(key)
+        if entry is None or entry[0] != generation or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key: Hashable, generation: int, value: Any) -> None:
+        self._data[key] = (generation, time.monotonic() + self.ttl_s, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+def etag(generation: int, path: str, params: Iterable[tuple[str, str]], accept: str) -> str:
+    """
+    ETag débil de una respuesta de lectura: la generación del warehouse más un hash
+    de la ruta, los parámetros (sin importar el orden) y el Accept. Cambia con cada
+    carga, así que no hace falta guardar nada para validarlo.
+    """
+    key = "\n".join([path, accept, *(f"{k}={v}" for k, v in sorted(params))])
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    return f'W/"g{generation}-{digest}"'
+
+
+def etag_matches(if_none_match: str | None, tag: str) -> bool:
+    """Comparación débil de If-None-Match (lista separada por comas o '*') con `tag`."""
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or tag.removeprefix("W/") in (c.removeprefix("W/") for c in candidates)
+
+
+def cache_control(max_age_s: int) -> str:
+    """Con max-age 0 el cliente guarda la respuesta pero la revalida siempre (304 barato)."""
+    return f"public, max-age={max_age_s}" if max_age_s > 0 else "public, no-cache"
+
+
+class GenerationValue(Generic[T]):
+    """
+    Un único valor caro de construir (p. ej. el índice temporal de /movies/top) que
+    se recarga cuando sube la generación del warehouse. `load` corre en un hilo para
+    no bloquear el event loop y las peticiones concurrentes esperan a la misma carga.
+    `generation_of` da la generación que leyó `load` (puede ser posterior a la pedida).
+    """
+
+    def __init__(self, load: Callable[[], T], generation_of: Callable[[T], int]) -> None:
+        self._load = load
+        self._generation_of = generation_of
+        self._value: T | None = None
+        self._lock = asyncio.Lock()
+        self.loads = 0
+
+    @property
+    def value(self) -> T | None:
+        return self._value
+
+    def _fresh(self, generation: int) -> T | None:
+        value = self._value
+        if value is not None and self._generation_of(value) >= generation:
+            return value
+        return None
+
+    async def get(self, generation: int) -> T:
+        value = self._fresh(generation)
+        if value is not None:
+            return value
+        async with self._lock:
+            value = self._fresh(generation)
+            if value is None:
+                value = await asyncio.to_thread(self._load)
+                self._value = value
+                self.loads += 1
+        return value
+
+
+class WarehouseGeneration:
+    """
+    Generación actual del warehouse. Con `start()` escucha el canal LISTEN/NOTIFY
+    que emite bump_generation y la sirve desde memoria; si no escucha (sin
+    lifespan, o la conexión se cayó) la consulta en etl_state en cada llamada.
+    Si la conexión se cae, `reconnect()` la reabre en segundo plano con backoff
+    exponencial (de `backoff_s` a `max_backoff_s`).
+    """
+
+    def __init__(self, backoff_s: float = 1.0, max_backoff_s: float = 60.0) -> None:
+        self.value = 0
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self._conn: asyncpg.Connection | None = None
+        self._reconnect: asyncio.Task[None] | None = None
+        self._stopped = False
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    async def current(self) -> int:
+        if self.listening:
+            return self.value
+        async with get_async_engine().connect() as c:
+            gen = (
+                await c.execute(
+                    text("SELECT watermark FROM etl_state WHERE source = :source"),
+                    {"source": etl_state.GENERATION},
+                )
+            ).scalar()
+        self.value = int(gen or 0)
+        return self.value
+
+    async def start(self) -> None:
+        self._stopped = False
+        conn = await asyncpg.connect(database_url(None))
+        # Primero el listener y después la lectura: no se pierde ningún bump intermedio
+        await conn.add_listener(etl_state.GENERATION_CHANNEL, self._on_notify)
+        conn.add_termination_listener(self._on_terminate)
+        gen = await conn.fetchval(
+            "SELECT watermark FROM etl_state WHERE source = $1", etl_state.GENERATION
+        )
+        self.value = max(self.value, int(gen or 0))
+        self._conn = conn
+
+    async def stop(self) -> None:
+        self._stopped = True
+        task, self._reconnect = self._reconnect, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            await conn.close()
+
+    def reconnect(self) -> None:
+        """Lanza (si no hay ya uno) el reintento de `start()` en segundo plano."""
+        if not self._stopped and (self._reconnect is None or self._reconnect.done()):
+            self._reconnect = asyncio.get_running_loop().create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self) -> None:
+        delay = self.backoff_s
+        while not self._stopped and not self.listening:
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.wait_for(self.start(), timeout=5)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+                delay = min(delay * 2, self.max_backoff_s)
+                continue
+            print("[API] LISTEN de generación restablecido")
+
+    def _on_notify(self, conn: Any, pid: int, channel: str, payload: str) -> None:
+        self.value = max(self.value, int(payload))
+
+    def _on_terminate(self, conn: Any) -> None:
+        if conn is not self._conn:
+            return  # conexión ya sustituida o cerrada con stop()
+        self._conn = None
+        print(
+            "[API] Conexión LISTEN de generación perdida; se consultará etl_state hasta reconectar"
+        )
+        self.reconnect()
+
+
+async def start_generation_listener(generation: WarehouseGeneration) -> None:
+    """Arranca el listener sin bloquear el arranque si Postgres aún no responde."""
+    try:
+        await asyncio.wait_for(generation.start(), timeout=5)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        print(f"[API] Sin LISTEN de generación ({e!r}); se consultará etl_state y se reintentará")
+        generation.reconnect()
@@ -0,0 +1,89 @@
+"""Negociación de contenido y serializadores (JSON, NDJSON, Arrow IPC, Parquet) de la API."""
+
+from __future__ import annotations
+
+import io
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Any, Iterable, Mapping, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+
+# Alias que también se aceptan en la cabecera Accept
+_ALIASES = {
+    "application/json": JSON,
+    "application/x-ndjson": NDJSON,
+    "application/jsonlines": NDJSON,
+    "application/vnd.apache.arrow.stream": ARROW,
+    "application/vnd.apache.arrow.file": ARROW,
+    "application/vnd.apache.parquet": PARQUET,
+    "application/x-parquet": PARQUET,
+}
+
+
+def negotiate(accept: str | None) -> str:
+    """
+    Formato de respuesta según la cabecera Accept: el tipo soportado con mayor `q`
+    (a igualdad, el primero). Sin Accept, con */* o sin coincidencias: JSON.
+    """
+    best, best_q = JSON, 0.0
+    for part in (accept or "").split(","):
+        media, _, params = part.strip().partition(";")
+        fmt = _ALIASES.get(media.strip().lower())
+        if fmt is None:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} no serializable")
+
+
+def ndjson_lines(rows: Iterable[Mapping[Any, Any]]) -> bytes:
+    """Una línea JSON por fila (mismas conversiones que la respuesta JSON)."""
+    return b"".join(
+        json.dumps(dict(r), default=_json_default, separators=(",", ":")).encode() + b"\n"
+        for r in rows
+    )
+
+
+def to_arrow(rows: Sequence[Mapping[str, Any]], schema: pa.Schema) -> pa.Table:
+    """Tabla Arrow columnar a partir de filas (una lista por columna, sin DataFrame)."""
+    return pa.table(
+        {f.name: pa.array([r[f.name] for r in rows], type=f.type) for f in schema},
+        schema=schema,
+    )
+
+
+def arrow_ipc(table: pa.Table) -> bytes:
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def parquet_bytes(table: pa.Table) -> bytes:
+    sink = io.BytesIO()
+    pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue()
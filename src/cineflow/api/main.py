@@ -1,61 +1,409 @@
-from fastapi import FastAPI, Query
+import time
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import pyarrow as pa
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from starlette.routing import Match
+
+from cineflow.analytics.similarity import SimilarityIndex
+from cineflow.analytics.time_index import MovieIndex
+from cineflow.api import formats, telemetry
+from cineflow.api.cache import (
+    GenerationValue,
+    ResponseCache,
+    WarehouseGeneration,
+    cache_control,
+    etag,
+    etag_matches,
+    start_generation_listener,
+)
+from cineflow.storage.postgres_async import (
+    async_pool_stats,
+    dispose_async_engine,
+    get_async_engine,
+)
+from cineflow.storage.postgres_client import get_engine, pool_stats
+from cineflow.utils.config import settings
+
+Items = dict[str, list[dict[str, object]]]
+_items_json = TypeAdapter(Items)
+
+DAILY_PAGE_SIZE = 1000  # filas por página JSON de /metrics/daily con `after` y sin `limit`
+STREAM_CHUNK_ROWS = 500  # filas por trozo del cursor de servidor en NDJSON
+# Lecturas del warehouse: llevan ETag por generación y aceptan If-None-Match
+CONDITIONAL_PREFIXES = ("/movies/", "/metrics/daily", "/genres/")
+DAILY_SCHEMA = pa.schema(
+    [
+        ("rating_date", pa.date32()),
+        ("ratings_cnt", pa.int32()),
+        ("users_active", pa.int32()),
+        ("avg_rating", pa.float64()),
+    ]
+)
+
+response_cache = ResponseCache(settings.API_CACHE_MAXSIZE, settings.API_CACHE_TTL_S)
+generation = WarehouseGeneration()
+
+
+def load_movie_index() -> MovieIndex:
+    with telemetry.phase("pool"):
+        conn = get_engine().connect()
+    with conn:
+        return MovieIndex.load(conn)
+
+
+# Índice temporal de /movies/top con ventana o género (pool síncrono, en un hilo)
+movie_index = GenerationValue(load_movie_index, lambda index: index.generation)
+
+
+def load_similarity_index() -> SimilarityIndex:
+    with telemetry.phase("pool"):
+        conn = get_engine().connect()
+    with conn:
+        return SimilarityIndex.load(conn)
+
+
+# Vecinos de /movies/{movie_id}/similar (tabla movie_similarity entera en memoria)
+similarity_index = GenerationValue(load_similarity_index, lambda index: index.generation)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # Abre el pool asyncpg al arrancar (primera petición sin handshake) y lo cierra al apagar
+    telemetry.install()
+    engine = get_async_engine()
+    async with engine.connect():
+        pass
+    await start_generation_listener(generation)
+    yield
+    await generation.stop()
+    await dispose_async_engine()
+
+
+app = FastAPI(title="CineFlow API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def conditional_get(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """
+    ETag = generación del warehouse + ruta, parámetros y Accept. Si el cliente ya
+    tiene esa versión (If-None-Match) se responde 304 sin llegar al endpoint, así
+    que no se consulta la base ni se serializa nada. La generación se lee antes que
+    el endpoint: el cuerpo nunca es más antiguo que su ETag.
+    """
+    path = request.url.path
+    if request.method not in ("GET", "HEAD") or not path.startswith(CONDITIONAL_PREFIXES):
+        return await call_next(request)
+    gen = await generation.current()
+    tag = etag(gen, path, request.query_params.multi_items(), request.headers.get("accept", ""))
+    headers = {
+        "ETag": tag,
+        "Cache-Control": cache_control(settings.API_HTTP_MAX_AGE_S),
+        "Vary": "Accept",
+    }
+    if etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
+
+
+def route_label(request: Request) -> str:
+    """Plantilla de la ruta ('/movies/{movie_id}/similar'): etiqueta de baja cardinalidad."""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match != Match.NONE:
+            return str(getattr(route, "path", request.url.path))
+    return "unmatched"
+
+
+@app.middleware("http")
+async def timed_request(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """
+    Latencia por endpoint (incluidos los 304) y desglose por fases; con
+    API_SERVER_TIMING lo devuelve en la cabecera Server-Timing. En NDJSON mide hasta
+    las cabeceras: el cuerpo se envía después, en streaming.
+    """
+    endpoint = route_label(request)
+    t0 = time.perf_counter()
+    status = 500
+    with telemetry.request(endpoint) as timing:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            elapsed = time.perf_counter() - t0
+            telemetry.REQUEST_SECONDS.observe(elapsed, endpoint, request.method, str(status))
+    if settings.API_SERVER_TIMING:
+        response.headers["Server-Timing"] = timing.server_timing(elapsed)
+    return response
+
+
+@asynccontextmanager
+async def connection() -> AsyncIterator[AsyncConnection]:
+    """Conexión del pool asyncpg; la espera hasta obtenerla cuenta como fase 'pool'."""
+    with telemetry.phase("pool"):
+        conn = await get_async_engine().connect().start()
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+async def fetch_all(sql: str, params: dict[str, Any]) -> list[dict[str, object]]:
+    async with connection() as c:
+        result = await c.execute(text(sql), params)
+        with telemetry.phase("fetch"):
+            rows = result.mappings().all()
+    with telemetry.phase("convert"):
+        return [dict(r) for r in rows]
+
 
-from cineflow.storage.postgres_client import get_engine
+async def stream_ndjson(sql: str, params: dict[str, Any]) -> AsyncIterator[bytes]:
+    """NDJSON por trozos desde un cursor de servidor: la memoria no crece con las filas."""
+    async with connection() as c:
+        result = await c.stream(text(sql), params)
+        async for rows in result.mappings().partitions(STREAM_CHUNK_ROWS):
+            yield formats.ndjson_lines(rows)
 
-app = FastAPI(title="CineFlow API")
+
+async def cached_body(
+    endpoint: str,
+    params: dict[str, Any],
+    media_type: str,
+    compute: Callable[[], Awaitable[bytes]],
+) -> Response:
+    """
+    Sirve el cuerpo ya serializado desde la caché si se calculó con la generación
+    actual del warehouse; si no, lo calcula y lo guarda. La generación se lee antes
+    de consultar, así que una carga concurrente nunca deja una entrada adelantada.
+    """
+    gen = await generation.current()
+    key = (endpoint, media_type, tuple(sorted(params.items())))
+    body = response_cache.get(key, gen)
+    if body is None:
+        body = await compute()
+        response_cache.put(key, gen, body)
+    return Response(content=body, media_type=media_type)
+
+
+async def cached_json(
+    endpoint: str, params: dict[str, Any], compute: Callable[[], Awaitable[Items]]
+) -> Response:
+    async def body() -> bytes:
+        items = await compute()
+        with telemetry.phase("serialize"):
+            return _items_json.dump_json(items)
+
+    return await cached_body(endpoint, params, formats.JSON, body)
 
 
 @app.get("/health")
-def health() -> dict[str, str]:
+async def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
-@app.get("/movies/top")
-def top_movies(limit: int = Query(10, ge=1, le=100)) -> dict[str, list[dict[str, object]]]:
-    engine = get_engine()
-    sql = text("""
-        SELECT m.movie_id, m.title, m.genres,
-               COUNT(f.user_id) AS ratings,
-               ROUND(AVG(f.rating)::numeric,2) AS avg_rating
-        FROM fact_rating f
-        JOIN dim_movie m ON m.movie_id = f.movie_id
-        GROUP BY m.movie_id, m.title, m.genres
-        HAVING COUNT(f.user_id) >= 10
-        ORDER BY avg_rating DESC, ratings DESC
-        LIMIT :limit
-    """)
-    with engine.begin() as c:
-        rows = c.execute(sql, {"limit": limit}).mappings().all()
-    return {"items": [dict(r) for r in rows]}
+@app.get("/health/pool")
+async def health_pool() -> dict[str, object]:
+    return {
+        "pools": pool_stats() + async_pool_stats(),
+        "cache": response_cache.stats(),
+        "generation": {"value": generation.value, "listening": generation.listening},
+        "movie_index": movie_index_stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Latencias, fases y SQL por endpoint, pools y caché en formato texto de Prometheus."""
+    pools = [("async", p) for p in async_pool_stats()] + [("sync", p) for p in pool_stats()]
+    cache = response_cache.stats()
+    extra = telemetry.gauge(
+        "cineflow_api_pool_connections",
+        "Conexiones de los pools Postgres por estado",
+        [
+            ({"pool": kind, "state": state}, float(p[state]))
+            for kind, p in pools
+            for state in ("checked_out", "checked_in")
+        ],
+    )
+    extra += telemetry.gauge(
+        "cineflow_api_cache_requests",
+        "Consultas a la caché de respuestas desde el arranque",
+        [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])],
+    )
+    extra += telemetry.gauge(
+        "cineflow_api_warehouse_generation", "Generación del warehouse", [({}, generation.value)]
+    )
+    return PlainTextResponse(
+        telemetry.prometheus_text(extra), media_type="text/plain; version=0.0.4"
+    )
+
+
+def movie_index_stats() -> dict[str, object]:
+    index = movie_index.value
+    if index is None:
+        return {"loaded": False, "loads": movie_index.loads}
+    return {
+        "loaded": True,
+        "loads": movie_index.loads,
+        "generation": index.generation,
+        "bytes": index.nbytes,
+    }
+
+
+@app.get("/movies/top", response_model=Items)
+async def top_movies(
+    limit: int = Query(10, ge=1, le=100),
+    min_votes: int = Query(10, ge=1),
+    since: date | None = None,
+    until: date | None = None,
+    genre: str | None = None,
+) -> Response:
+    """
+    Películas mejor valoradas con al menos `min_votes` ratings. Sin ventana ni género
+    sale de movie_stats; con `since`/`until` (incluidos) o `genre` se resuelve con el
+    índice temporal en memoria (analytics.time_index), cargado una vez por generación:
+    dos búsquedas binarias por película, así que no depende del tamaño de la ventana.
+    """
+    params: dict[str, Any] = {
+        "limit": limit,
+        "min_votes": min_votes,
+        "since": since,
+        "until": until,
+        "genre": genre,
+    }
+    if since is None and until is None and genre is None:
+        # movie_stats está indexada por (avg_rating DESC, ratings DESC): sin agregar fact_rating
+        sql = """
+            SELECT m.movie_id, m.title, m.genres, s.ratings, s.avg_rating
+            FROM movie_stats s
+            JOIN dim_movie m ON m.movie_id = s.movie_id
+            WHERE s.ratings >= :min_votes
+            ORDER BY s.avg_rating DESC, s.ratings DESC
+            LIMIT :limit
+        """
+
+        async def compute() -> Items:
+            return {"items": await fetch_all(sql, {"limit": limit, "min_votes": min_votes})}
+
+    else:
+
+        async def compute() -> Items:
+            index = await movie_index.get(await generation.current())
+            return {"items": index.top_movies(limit, min_votes, since, until, genre)}
 
+    return await cached_json("movies_top", params, compute)
 
-@app.get("/metrics/daily")
-def metrics_daily(since: str | None = None) -> dict[str, list[dict[str, object]]]:
-    engine = get_engine()
-    base = "SELECT * FROM mv_daily_metrics"
+
+@app.get("/movies/{movie_id}/similar", response_model=Items)
+async def similar_movies(movie_id: int, limit: int = Query(10, ge=1, le=100)) -> Response:
+    """
+    Películas más parecidas a `movie_id` (coseno ajustado, etapa similarity del
+    runner), de mayor a menor similitud. Los vecinos se leen una vez por generación
+    y cada consulta es una búsqueda binaria en memoria.
+    """
+
+    async def compute() -> Items:
+        index = await similarity_index.get(await generation.current())
+        items = index.similar(movie_id, limit)
+        if items is None:
+            raise HTTPException(status_code=404, detail=f"Película {movie_id} no encontrada")
+        return {"items": items}
+
+    return await cached_json("movies_similar", {"movie_id": movie_id, "limit": limit}, compute)
+
+
+@app.get(
+    "/metrics/daily",
+    response_model=Items,
+    responses={
+        200: {
+            "content": {
+                formats.NDJSON: {},
+                formats.ARROW: {},
+                formats.PARQUET: {},
+            }
+        }
+    },
+)
+async def metrics_daily(
+    since: date | None = None,
+    after: date | None = None,
+    limit: int | None = Query(None, ge=1, le=100_000),
+    accept: str | None = Header(None),
+) -> Response:
+    """
+    Serie diaria ordenada por fecha; sin `after` ni `limit` se devuelve entera, como
+    siempre. Paginación por clave opcional: `after` = última rating_date recibida
+    (páginas JSON de DAILY_PAGE_SIZE filas si no se indica `limit`). Con Accept
+    NDJSON, Arrow IPC o Parquet se sirve la serie (o hasta `limit`) sin pasar por
+    objetos JSON.
+    """
+    fmt = formats.negotiate(accept)
+    if fmt == formats.JSON and after:
+        limit = limit or DAILY_PAGE_SIZE
+    columnar = fmt in (formats.ARROW, formats.PARQUET)
+    avg = "avg_rating::float8 AS avg_rating" if columnar else "avg_rating"
+    sql = f"SELECT rating_date, ratings_cnt, users_active, {avg} FROM daily_metrics"
+    where = []
+    params: dict[str, Any] = {}
     if since:
-        base += " WHERE rating_date >= :since"
-    base += " ORDER BY rating_date"
-    with engine.begin() as c:
-        rows = c.execute(text(base), {"since": since} if since else {}).mappings().all()
-    return {"items": [dict(r) for r in rows]}
-
-
-@app.get("/genres/top")
-def top_genres(limit: int = Query(10, ge=1, le=50)) -> dict[str, list[dict[str, object]]]:
-    sql = text("""
-        SELECT unnest(string_to_array(m.genres, '|')) AS genre,
-               COUNT(f.rating) AS total_ratings,
-               ROUND(AVG(f.rating)::numeric, 2) AS avg_rating
-        FROM fact_rating f
-        JOIN dim_movie m ON m.movie_id = f.movie_id
-        GROUP BY genre
-        HAVING COUNT(f.rating) >= 10
+        where.append("rating_date >= :since")
+        params["since"] = since
+    if after:
+        where.append("rating_date > :after")
+        params["after"] = after
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY rating_date"
+    if limit:
+        sql += " LIMIT :limit"
+        params["limit"] = limit
+
+    if fmt == formats.NDJSON:
+        return StreamingResponse(stream_ndjson(sql, params), media_type=fmt)
+    key = {"since": since, "after": after, "limit": limit}
+    if columnar:
+
+        async def columns() -> bytes:
+            rows = await fetch_all(sql, params)
+            with telemetry.phase("serialize"):
+                table = formats.to_arrow(rows, DAILY_SCHEMA)
+                if fmt == formats.ARROW:
+                    return formats.arrow_ipc(table)
+                return formats.parquet_bytes(table)
+
+        return await cached_body("metrics_daily", key, fmt, columns)
+
+    async def compute() -> Items:
+        return {"items": await fetch_all(sql, params)}
+
+    return await cached_json("metrics_daily", key, compute)
+
+
+@app.get("/genres/top", response_model=Items)
+async def top_genres(limit: int = Query(10, ge=1, le=50)) -> Response:
+    sql = """
+        SELECT genre, total_ratings, avg_rating
+        FROM genre_stats
+        WHERE total_ratings >= 10
         ORDER BY avg_rating DESC, total_ratings DESC
         LIMIT :limit
-    """)
-    engine = get_engine()
-    with engine.begin() as c:
-        rows = c.execute(sql, {"limit": limit}).mappings().all()
-    return {"items": [dict(r) for r in rows]}
+    """
+
+    async def compute() -> Items:
+        return {"items": await fetch_all(sql, {"limit": limit})}
+
+    return await cached_json("genres_top", {"limit": limit}, compute)
@@ -0,0 +1,222 @@
+"""
+Telemetría de la API: histogramas de latencia por endpoint, por fase de la petición
+(espera de pool, SQL, lectura de filas, conversión y serialización) y por sentencia
+SQL, expuestos en formato texto de Prometheus.
+
+La petición activa vive en un ContextVar que fija el middleware: los listeners de
+SQLAlchemy (también los que corren en el greenlet de asyncpg o en un hilo lanzado
+con asyncio.to_thread) atribuyen cada sentencia al endpoint que la originó.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Límites superiores (segundos) de los buckets: de 0.5 ms a 10 s
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("pool", "sql", "fetch", "convert", "serialize")
+
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([\w.]+)", re.IGNORECASE)
+
+
+class Histogram:
+    """Histograma acumulativo de Prometheus con una serie por combinación de etiquetas."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._series: dict[tuple[str, ...], list[float]] = {}  # buckets..., +Inf, suma
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(BUCKETS) + 2)
+            series[bisect.bisect_left(BUCKETS, value)] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return 0 if series is None else int(sum(series[:-1]))
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, series in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, labels))
+            cumulative = 0.0
+            for le, n in zip((*BUCKETS, "+Inf"), series[:-1]):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {cumulative:.0f}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative:.0f}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, labels))
+            lines.append(f"{self.name}{{{base}}} {value:.0f}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "cineflow_api_request_seconds",
+    "Latencia de las peticiones por endpoint",
+    ("endpoint", "method", "status"),
+)
+PHASE_SECONDS = Histogram(
+    "cineflow_api_phase_seconds",
+    "Tiempo por fase de la petición (pool, sql, fetch, convert, serialize)",
+    ("endpoint", "phase"),
+)
+SQL_SECONDS = Histogram(
+    "cineflow_api_sql_seconds",
+    "Duración de cada sentencia SQL (incluye recibir las filas)",
+    ("endpoint", "statement"),
+)
+SQL_ROWS = Counter(
+    "cineflow_api_sql_rows_total",
+    "Filas devueltas o afectadas por sentencia",
+    ("endpoint", "statement"),
+)
+
+
+@dataclass
+class RequestTiming:
+    """Tiempos acumulados por fase de una petición (para Server-Timing y los histogramas)."""
+
+    endpoint: str
+    phases: dict[str, float] = field(default_factory=lambda: dict.fromkeys(PHASES, 0.0))
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self, total_s: float) -> str:
+        parts = [f"{p};dur={s * 1000:.2f}" for p, s in self.phases.items() if s > 0]
+        return ", ".join([*parts, f"app;dur={total_s * 1000:.2f}"])
+
+
+_current: contextvars.ContextVar[RequestTiming | None] = contextvars.ContextVar(
+    "cineflow_api_timing", default=None
+)
+_installed = False
+_install_lock = threading.Lock()
+
+
+@contextmanager
+def request(endpoint: str) -> Iterator[RequestTiming]:
+    """Activa la medición de una petición a `endpoint` en este contexto."""
+    timing = RequestTiming(endpoint)
+    token = _current.set(timing)
+    try:
+        yield timing
+    finally:
+        _current.reset(token)
+        for phase, seconds in timing.phases.items():
+            if seconds > 0:
+                PHASE_SECONDS.observe(seconds, endpoint, phase)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Suma la duración del bloque a la fase `name` de la petición activa."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _current.get()
+        if timing is not None:
+            timing.add(name, time.perf_counter() - t0)
+
+
+def statement_label(statement: str) -> str:
+    """Etiqueta de baja cardinalidad: verbo y primera tabla ('SELECT movie_stats')."""
+    words = statement.split(None, 1)
+    verb = words[0].upper() if words else "?"
+    table = _TABLE.search(statement)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    if _current.get() is not None and context is not None:
+        # En el contexto de la sentencia: si falla, el inicio se descarta con ella
+        context.cineflow_api_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    timing = _current.get()
+    t0 = getattr(context, "cineflow_api_t0", None)
+    if timing is None or t0 is None:
+        return
+    seconds = time.perf_counter() - t0
+    label = statement_label(statement)
+    timing.add("sql", seconds)
+    SQL_SECONDS.observe(seconds, timing.endpoint, label)
+    if cursor.rowcount > 0:  # -1 con cursores de servidor (NDJSON)
+        SQL_ROWS.inc(cursor.rowcount, timing.endpoint, label)
+
+
+def install() -> None:
+    """Registra los listeners de cursor (una vez por proceso; engines síncronos y asyncpg)."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _installed = True
+
+
+def gauge(name: str, help_text: str, samples: Sequence[tuple[dict[str, str], float]]) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        base = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{base}}} {value:g}" if base else f"{name} {value:g}")
+    return lines
+
+
+def prometheus_text(extra: Sequence[str] = ()) -> str:
+    """Histogramas y contadores acumulados desde el arranque, más las líneas de `extra`."""
+    lines: list[str] = []
+    for metric in (REQUEST_SECONDS, PHASE_SECONDS, SQL_SECONDS, SQL_ROWS):
+        lines += metric.render()
+    return "\n".join([*lines, *extra]) + "\n"
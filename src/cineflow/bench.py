@@ -0,0 +1,193 @@
+"""
+Benchmarks del pipeline sobre datos sintéticos (tools.synth) contra Postgres y Mongo
+locales: cada etapa se mide con utils.metrics (tiempo, filas/s, pico de RSS, viajes
+y bytes a las bases) y se compara con la línea base guardada en bench/baselines.
+
+    cineflow-bench pipeline --scale 1M            # mide y compara con la base
+    cineflow-bench pipeline --scale 1M --save     # actualiza la base (se revisa con git diff)
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Mapping, Optional
+
+from cineflow.dq.checks import validate_movies, validate_ratings
+from cineflow.dq.warehouse import validate_warehouse
+from cineflow.pipelines.build_similarity import main as step_similarity
+from cineflow.pipelines.ingest_raw import main as step_ingest
+from cineflow.pipelines.load_warehouse import main as step_load
+from cineflow.storage.postgres_admin import create_indexes, refresh_views
+from cineflow.storage.postgres_client import init_schema
+from cineflow.tools import synth
+from cineflow.utils import metrics
+from cineflow.utils.config import settings
+
+BASELINE_DIR = Path("bench/baselines")
+DATA_ROOT = Path("data/bench")
+THRESHOLD = 0.20  # empeorar más de un 20 % cuenta como regresión
+MIN_SECONDS = 0.05  # por debajo, el tiempo es ruido y no se compara
+# Métricas comparadas con la base (en todas, más es peor)
+COMPARED = ("seconds", "peak_rss_bytes", "postgres_roundtrips", "mongo_roundtrips")
+
+
+def require_bench_databases() -> None:
+    """
+    La suite vacía Mongo raw y el warehouse (full refresh), así que solo se ejecuta
+    contra bases cuyo nombre contiene 'bench'.
+    """
+    names = {"POSTGRES_DB": settings.POSTGRES_DB, "MONGO_DB": settings.MONGO_DB}
+    wrong = [f"{var}={name}" for var, name in names.items() if "bench" not in name.lower()]
+    if wrong:
+        raise SystemExit(
+            f"cineflow-bench borra los datos de {', '.join(wrong)}; usa bases de benchmark"
+            " (p. ej. POSTGRES_DB=cineflow_bench MONGO_DB=cineflow_bench)"
+        )
+
+
+def scale_label(n: int) -> str:
+    for suffix, unit in (("B", 1_000_000_000), ("M", 1_000_000), ("K", 1_000)):
+        if n % unit == 0:
+            return f"{n // unit}{suffix}"
+    return str(n)
+
+
+def pipeline_stages(workers: Optional[int]) -> list[tuple[str, Callable[[], object]]]:
+    """Etapas del runner en serie, con full refresh para medir siempre el mismo trabajo."""
+    return [
+        ("ingest", lambda: step_ingest(full_refresh=True)),
+        ("dq_ratings", validate_ratings),
+        ("dq_movies", validate_movies),
+        ("load", lambda: step_load(full_refresh=True, workers=workers)),
+        ("dq_warehouse", validate_warehouse),
+        ("admin_indexes", create_indexes),
+        ("admin_views", refresh_views),
+        ("similarity", step_similarity),
+    ]
+
+
+def run_pipeline(
+    dims: synth.Dims, fmt: str, workers: Optional[int], data_root: Path = DATA_ROOT
+) -> list[metrics.StageMetrics]:
+    """Genera (o reutiliza) el staging de `dims` y mide cada etapa del pipeline en serie."""
+    require_bench_databases()
+    out = data_root / f"{scale_label(dims.ratings)}-seed{dims.seed}-{fmt}"
+    if synth.is_current(out, dims, fmt):
+        print(f"[bench] Reutilizo el staging sintético de {out}")
+    else:
+        t0 = time.perf_counter()
+        synth.generate(dims, out, fmt)
+        print(f"[bench] Staging sintético en {out} ({time.perf_counter() - t0:.2f}s)")
+    settings.DATA_DIR = str(out)
+
+    metrics.install()
+    # Mismo esquema en todas las ejecuciones: en la primera aún no existirían los
+    # índices de admin y la carga (que los mantiene) saldría más rápida de lo real
+    init_schema()
+    create_indexes()
+    results = []
+    for name, step in pipeline_stages(workers):
+        # En serie: el pico de RSS se reinicia para atribuirlo a cada etapa
+        gc.collect()
+        print(f"[bench] {name} ...", flush=True)
+        with metrics.measure(name, isolated_rss=True) as m:
+            step()
+        results.append(m)
+        print(f"[bench] {name}: {m.seconds:.2f}s | {m.summary()}")
+    return results
+
+
+def result_doc(
+    dims: synth.Dims, fmt: str, workers: Optional[int], stages: list[metrics.StageMetrics]
+) -> dict[str, Any]:
+    """Documento de resultados (formato de la línea base): estable y legible en un diff."""
+    return {
+        "suite": "pipeline",
+        "scale": scale_label(dims.ratings),
+        "dims": {"ratings": dims.ratings, "users": dims.users, "movies": dims.movies},
+        "seed": dims.seed,
+        "format": fmt,
+        "workers": workers or settings.LOAD_WORKERS,
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(terse=True),
+            "cpus": os.cpu_count(),
+        },
+        "stages": {m.stage: {k: v for k, v in m.to_dict().items() if k != "stage"} for m in stages},
+    }
+
+
+def compare(
+    baseline: Mapping[str, Any], current: Mapping[str, Any], threshold: float = THRESHOLD
+) -> list[str]:
+    """Imprime la tabla contra la base y devuelve las regresiones ('etapa.métrica +x%')."""
+    regressions = []
+    print(f"{'etapa':<15}{'métrica':<22}{'base':>14}{'ahora':>14}{'Δ':>9}")
+    for stage, now in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            print(f"{stage:<15}(nueva etapa, sin base)")
+            continue
+        for key in COMPARED:
+            old, new = base.get(key), now.get(key)
+            if old is None or new is None:
+                continue
+            if key == "seconds" and max(old, new) < MIN_SECONDS:
+                continue
+            delta = (new - old) / old if old else (0.0 if new == old else float("inf"))
+            mark = ""
+            if delta > threshold:
+                mark = "  <- REGRESIÓN"
+                regressions.append(f"{stage}.{key} {delta:+.0%}")
+            print(f"{stage:<15}{key:<22}{old:>14,.4g}{new:>14,.4g}{delta:>+9.1%}{mark}")
+    return regressions
+
+
+def baseline_path(scale: str, base_dir: Path = BASELINE_DIR) -> Path:
+    return base_dir / f"pipeline-{scale}.json"
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks de CineFlow")
+    sub = parser.add_subparsers(dest="suite", required=True)
+    p = sub.add_parser("pipeline", help="Ingesta, DQ, carga y admin sobre datos sintéticos")
+    p.add_argument("--scale", default="1M", help="Ratings sintéticos: 100K, 1M, 10M, 100M...")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--format", choices=("parquet", "csv"), default="parquet")
+    p.add_argument("--workers", type=int, default=None, help="Procesos de la carga")
+    p.add_argument("--data-dir", type=Path, default=DATA_ROOT, help="Staging sintético")
+    p.add_argument("--baseline", type=Path, default=None, help="Por defecto bench/baselines/")
+    p.add_argument("--save", action="store_true", help="Guarda el resultado como nueva base")
+    p.add_argument("--check", action="store_true", help="Sale con error si hay regresiones (CI)")
+    p.add_argument("--threshold", type=float, default=THRESHOLD, help="Empeoramiento tolerado")
+    args = parser.parse_args(argv)
+
+    dims = synth.Dims.for_scale(synth.parse_scale(args.scale), args.seed)
+    stages = run_pipeline(dims, args.format, args.workers, args.data_dir)
+    doc = result_doc(dims, args.format, args.workers, stages)
+    path = args.baseline or baseline_path(doc["scale"])
+
+    regressions: list[str] = []
+    if path.exists():
+        print(f"\n[bench] Comparando con {path}")
+        regressions = compare(json.loads(path.read_text()), doc, args.threshold)
+    else:
+        print(f"\n[bench] Sin línea base en {path} (usa --save para crearla)")
+    if args.save:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(doc, indent=2, sort_keys=True, ensure_ascii=False) + "\n")
+        print(f"[bench] Línea base guardada en {path}")
+    if regressions:
+        print(f"[bench] Regresiones: {', '.join(regressions)}")
+        if args.check:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,53 @@
-from pathlib import Path
-
-import pandas as pd
-
-BASE = Path("data/samples")
-
-
-def validate_ratings() -> None:
-    df = pd.read_csv(BASE / "ratings.csv")
-    assert df["rating"].between(0, 5).all(), "Ratings fuera de 0–5"
-    assert df[["userId", "movieId", "timestamp"]].notna().all().all(), "Nulos en claves"
-
-    dups = df.duplicated(subset=["userId", "movieId", "timestamp"]).sum()
-    assert dups == 0, f"Duplicados en ratings: {dups}"
-
-
-def validate_movies() -> None:
-    df = pd.read_csv(BASE / "movies.csv")
-    assert df["movieId"].notna().all(), "movieId nulo"
-    assert df["title"].notna().all(), "title nulo"
+from cineflow.dq.engine import (
+    DQReport,
+    NotNullRule,
+    RangeRule,
+    UniqueRule,
+    estimate_rows,
+    run_rules,
+)
+from cineflow.utils.config import settings
+
+RATING_KEY = ["userId", "movieId", "timestamp"]
+
+
+def validate_ratings() -> DQReport:
+    """Rango, nulos y clave única de ratings en una sola pasada por el staging."""
+    rules = [
+        RangeRule("rating", 0, 5, name="rating_0_5"),
+        NotNullRule(RATING_KEY, name="keys_not_null"),
+        UniqueRule(
+            RATING_KEY,
+            expected_rows=estimate_rows("ratings"),
+            fp_rate=settings.DQ_BLOOM_FP_RATE,
+            memory_bytes=settings.DQ_MEMORY_MB << 20,
+            name="key_unique",
+        ),
+    ]
+    report = run_rules("ratings", rules, settings.DQ_CHUNK_SIZE)
+    print(report.summary())
+    assert report.violations("rating_0_5") == 0, (
+        f"Ratings fuera de 0–5: {report.violations('rating_0_5')}"
+    )
+    assert report.violations("keys_not_null") == 0, (
+        f"Nulos en claves: {report.violations('keys_not_null')}"
+    )
+    assert report.violations("key_unique") == 0, (
+        f"Duplicados en ratings: {report.violations('key_unique')}"
+    )
+    return report
+
+
+def validate_movies() -> DQReport:
+    rules = [
+        NotNullRule(["movieId"], name="movieId_not_null"),
+        NotNullRule(["title"], name="title_not_null"),
+    ]
+    report = run_rules("movies", rules, settings.DQ_CHUNK_SIZE)
+    print(report.summary())
+    assert report.violations("movieId_not_null") == 0, "movieId nulo"
+    assert report.violations("title_not_null") == 0, "title nulo"
+    return report
 
 
 if __name__ == "__main__":
@@ -0,0 +1,258 @@
+"""Motor de calidad de datos: todas las reglas en una sola pasada por lotes sobre el staging."""
+
+from __future__ import annotations
+
+import math
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from cineflow.storage.staging import iter_batches, resolve
+from cineflow.utils import metrics
+
+
+class Rule(ABC):
+    """Regla evaluada lote a lote: `update` suma violaciones, `finish` da el total."""
+
+    name: str
+    columns: tuple[str, ...]
+    approximate = False
+
+    @abstractmethod
+    def update(self, chunk: pd.DataFrame) -> None: ...
+
+    @abstractmethod
+    def finish(self) -> int: ...
+
+
+class RangeRule(Rule):
+    """`column` dentro de [lo, hi]; un nulo también cuenta como fuera de rango."""
+
+    def __init__(self, column: str, lo: float, hi: float, name: str | None = None) -> None:
+        self.name = name or f"range({column})"
+        self.columns = (column,)
+        self.lo, self.hi = lo, hi
+        self.violations = 0
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        ok = chunk[self.columns[0]].between(self.lo, self.hi)
+        self.violations += int(len(ok) - ok.sum())
+
+    def finish(self) -> int:
+        return self.violations
+
+
+class NotNullRule(Rule):
+    """Filas con algún nulo en `columns`."""
+
+    def __init__(self, columns: Sequence[str], name: str | None = None) -> None:
+        self.name = name or f"not_null({','.join(columns)})"
+        self.columns = tuple(columns)
+        self.violations = 0
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.violations += int(chunk[list(self.columns)].isna().any(axis=1).sum())
+
+    def finish(self) -> int:
+        return self.violations
+
+
+class UniqueRule(Rule):
+    """
+    Filas cuya clave `columns` ya apareció antes (como DataFrame.duplicated).
+
+    Cada clave se reduce a un hash de 64 bits y hay tres modos:
+      - memoria: se guardan los hashes (8 bytes por fila) y al final se ordenan.
+      - spill: si `expected_rows` no cabe en `memory_bytes`, los hashes se reparten
+        por sus bits altos en ficheros temporales y cada cubo se ordena por separado;
+        exacto y con memoria acotada por el tamaño de un cubo.
+      - bloom (`fp_rate` > 0): filtro de Bloom por bloques de tamaño fijo, sin disco;
+        el recuento es una cota superior (falsos positivos, nunca falsos negativos).
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        expected_rows: int = 0,
+        fp_rate: float = 0.0,
+        memory_bytes: int = 0,
+        name: str | None = None,
+    ) -> None:
+        self.name = name or f"unique({','.join(columns)})"
+        self.columns = tuple(columns)
+        self.duplicates = 0
+        self.approximate = fp_rate > 0
+        n = max(expected_rows, 1)
+        if self.approximate:
+            self.mode = "bloom"
+            # Tamaño del Bloom clásico +30 %: los bloques de 64 bits se saturan antes
+            bits = -n * math.log(fp_rate) / math.log(2) ** 2
+            self._words = np.zeros(max(1, int(math.ceil(1.3 * bits / 64))), dtype=np.uint64)
+            self._k = min(8, max(1, round(bits / n * math.log(2))))
+        elif memory_bytes and 8 * n > memory_bytes:
+            self.mode = "spill"
+            self._bucket_bits = max(1, math.ceil(math.log2(8 * n / memory_bytes)))
+            self._spill = tempfile.TemporaryDirectory(prefix="cineflow-dq-")
+            self._files = [
+                open(Path(self._spill.name) / f"{b}.u64", "wb")
+                for b in range(1 << self._bucket_bits)
+            ]
+        else:
+            self.mode = "memory"
+            self._keys = np.empty(max(expected_rows, 1024), dtype=np.uint64)
+            self._n = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        """Memoria reservada por la regla (sin contar el lote en curso)."""
+        if self.mode == "bloom":
+            return int(self._words.nbytes)
+        if self.mode == "memory":
+            return int(self._keys.nbytes)
+        return 0
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        hashes = pd.util.hash_pandas_object(chunk[list(self.columns)], index=False).to_numpy()
+        # Repetidos dentro del lote (exactos en todos los modos): ordenar y comparar vecinos
+        hashes = np.sort(hashes)
+        fresh = np.ones(len(hashes), dtype=bool)
+        fresh[1:] = hashes[1:] != hashes[:-1]
+        keys = hashes[fresh]
+        self.duplicates += len(hashes) - len(keys)
+        if self.mode == "bloom":
+            self._bloom_add(keys)
+        elif self.mode == "spill":
+            # `keys` está ordenado, así que cada cubo (bits altos) es un tramo contiguo
+            shift = np.uint64(64 - self._bucket_bits)
+            bounds = np.searchsorted(keys >> shift, np.arange(len(self._files) + 1))
+            for b, f in enumerate(self._files):
+                keys[bounds[b] : bounds[b + 1]].tofile(f)
+        else:
+            if self._n + len(keys) > len(self._keys):
+                self._keys = np.resize(self._keys, max(2 * len(self._keys), self._n + len(keys)))
+            self._keys[self._n : self._n + len(keys)] = keys
+            self._n += len(keys)
+
+    def _bloom_add(self, keys: np.ndarray) -> None:
+        # Bloom por bloques: cada clave vive en una palabra de 64 bits (elegida con la
+        # mitad alta del hash) y activa `k` bits de ella tomados de un segundo hash.
+        word = (keys >> np.uint64(32)) % np.uint64(len(self._words))
+        mixed = keys * np.uint64(0x9E3779B97F4A7C15)
+        mask = np.zeros(len(keys), dtype=np.uint64)
+        for i in range(self._k):
+            mask |= np.uint64(1) << ((mixed >> np.uint64(6 * i)) & np.uint64(63))
+        self.duplicates += int(np.count_nonzero((self._words[word] & mask) == mask))
+        np.bitwise_or.at(self._words, word, mask)
+
+    @staticmethod
+    def _count_repeated(keys: np.ndarray) -> int:
+        keys.sort()
+        return int(np.count_nonzero(keys[1:] == keys[:-1]))
+
+    def finish(self) -> int:
+        if self.mode == "memory":
+            self.duplicates += self._count_repeated(self._keys[: self._n])
+            self._keys = np.empty(0, dtype=np.uint64)
+            self._n = 0
+        elif self.mode == "spill":
+            for f in self._files:
+                f.close()
+                self.duplicates += self._count_repeated(np.fromfile(f.name, dtype=np.uint64))
+            self._files = []
+            self._spill.cleanup()
+        return self.duplicates
+
+
+@dataclass
+class RuleResult:
+    rule: str
+    violations: int
+    seconds: float
+    approximate: bool = False
+
+
+@dataclass
+class DQReport:
+    dataset: str
+    rows: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    results: list[RuleResult] = field(default_factory=list)
+    unit: str = "filas"  # qué cuenta `rows` (vacío: no se muestra)
+
+    @property
+    def ok(self) -> bool:
+        return all(r.violations == 0 for r in self.results)
+
+    def violations(self, rule: str) -> int:
+        return next(r.violations for r in self.results if r.rule == rule)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "dataset": self.dataset,
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "seconds": round(self.seconds, 4),
+            "ok": self.ok,
+            "rules": [
+                {
+                    "rule": r.rule,
+                    "violations": r.violations,
+                    "seconds": round(r.seconds, 4),
+                    "approximate": r.approximate,
+                }
+                for r in self.results
+            ],
+        }
+
+    def summary(self) -> str:
+        size = f"{self.rows} {self.unit} " if self.unit else ""
+        lines = [f"[DQ] {self.dataset}: {size}en {self.seconds:.2f}s"]
+        for r in self.results:
+            mark = "OK" if r.violations == 0 else f"{r.violations} violaciones"
+            approx = " (aprox.)" if r.approximate else ""
+            lines.append(f"  {r.rule}: {mark}{approx} [{r.seconds * 1000:.1f} ms]")
+        return "\n".join(lines)
+
+
+def estimate_rows(name: str, base: Path | None = None) -> int:
+    """Filas del staging: exactas en Parquet (metadatos), estimadas por tamaño en CSV."""
+    path = resolve(name, base)
+    if path.suffix == ".parquet":
+        return int(pq.ParquetFile(path).metadata.num_rows)
+    return path.stat().st_size // 16 + 1
+
+
+def run_rules(
+    name: str, rules: Sequence[Rule], chunk_size: int, base: Path | None = None
+) -> DQReport:
+    """
+    Recorre el staging `name` una sola vez en lotes de `chunk_size` filas (solo las
+    columnas que usan las reglas) y evalúa todas las reglas sobre cada lote.
+    """
+    columns = list(dict.fromkeys(c for rule in rules for c in rule.columns))
+    timings = [0.0] * len(rules)
+    report = DQReport(dataset=name)
+    t0 = time.perf_counter()
+    for chunk in iter_batches(name, chunk_size, columns=columns, base=base):
+        report.rows += len(chunk)
+        report.chunks += 1
+        for i, rule in enumerate(rules):
+            t = time.perf_counter()
+            rule.update(chunk)
+            timings[i] += time.perf_counter() - t
+    for i, rule in enumerate(rules):
+        t = time.perf_counter()
+        violations = rule.finish()
+        timings[i] += time.perf_counter() - t
+        report.results.append(RuleResult(rule.name, violations, timings[i], rule.approximate))
+    report.seconds = time.perf_counter() - t0
+    metrics.add_rows(rows_in=report.rows)
+    return report
@@ -0,0 +1,72 @@
+"""Vecinos item-item de cada película (coseno ajustado) guardados en movie_similarity."""
+
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from cineflow.analytics.similarity import COLUMNS, neighbours_frame
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_client import copy_dataframe, get_engine, init_schema
+from cineflow.utils import metrics
+from cineflow.utils.config import settings
+
+READ_CHUNK_ROWS = 1_000_000  # filas por lote del cursor de servidor sobre fact_rating
+
+
+def read_ratings() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(user_id, movie_id, rating) de fact_rating como arrays, leídos por lotes."""
+    users, movies, ratings = [], [], []
+    with get_engine().connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        for chunk in pd.read_sql(
+            text("SELECT user_id, movie_id, rating FROM fact_rating"),
+            conn,
+            chunksize=READ_CHUNK_ROWS,
+        ):
+            users.append(chunk["user_id"].to_numpy(np.int32))
+            movies.append(chunk["movie_id"].to_numpy(np.int32))
+            ratings.append(chunk["rating"].to_numpy(np.float32))
+    if not users:
+        empty = np.array([], dtype=np.int32)
+        return empty, empty, np.array([], dtype=np.float32)
+    return np.concatenate(users), np.concatenate(movies), np.concatenate(ratings)
+
+
+def main() -> int:
+    """
+    Reconstruye movie_similarity entera (DELETE + COPY en una transacción: por MVCC la
+    API sigue leyendo la versión anterior hasta el commit; TRUNCATE no sirve porque toma
+    ACCESS EXCLUSIVE y un snapshot anterior vería la tabla vacía) y sube la generación
+    para que recargue sus vecinos. Devuelve las filas escritas.
+    """
+    init_schema()
+    t0 = time.perf_counter()
+    users, movies, ratings = read_ratings()
+    t_read = time.perf_counter() - t0
+    frame = neighbours_frame(
+        users,
+        movies,
+        ratings,
+        k=settings.SIMILAR_K,
+        min_ratings=settings.SIMILAR_MIN_RATINGS,
+        memory_mb=settings.SIMILAR_MEMORY_MB,
+    )
+    t_sim = time.perf_counter() - t0 - t_read
+    with get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM movie_similarity"))
+        copy_dataframe(conn, frame, "movie_similarity", COLUMNS)
+        generation = etl_state.bump_generation(conn)
+    metrics.add_rows(rows_in=len(ratings), rows_out=len(frame))
+    n_movies = frame["movie_id"].nunique()
+    print(
+        f"movie_similarity: {len(frame)} vecinos de {n_movies} películas (K={settings.SIMILAR_K})"
+        f" desde {len(ratings)} ratings; lectura {t_read:.2f}s, cálculo {t_sim:.2f}s"
+        f" (generación {generation})"
+    )
+    return len(frame)
+
+
+if __name__ == "__main__":
+    main()
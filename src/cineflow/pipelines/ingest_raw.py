@@ -1,37 +1,182 @@
-"""Carga CSVs de MovieLens a MongoDB (colección ratings_raw y movies_raw)."""
+"""Carga el staging de MovieLens (Parquet o CSV) a MongoDB (ratings_raw y movies_raw)."""
 
 from __future__ import annotations
 
-from pathlib import Path
+import hashlib
+import time
+from typing import Any, Sequence
 
 import pandas as pd
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, OperationFailure
 
+from cineflow.storage import etl_state
 from cineflow.storage.mongo_client import get_mongo
+from cineflow.storage.postgres_client import get_engine, init_schema
+from cineflow.storage.staging import iter_batches, resolve
+from cineflow.utils import metrics
+from cineflow.utils.config import settings
 
-SAMPLES = Path("data/samples")
+RATING_KEY = ("userId", "movieId", "timestamp")
+DUPLICATE_KEY = 11000  # código de error de Mongo para claves únicas repetidas
 
 
-def main() -> None:
-    """Carga ratings.csv y movies.csv a MongoDB (colecciones ratings_raw y movies_raw)."""
+def ensure_unique_index(collection: Collection, fields: Sequence[str]) -> None:
+    """
+    Índice único sobre `fields`. Si existía el mismo índice sin `unique` (raw anterior)
+    se recrea; si la colección ya tiene duplicados, falla pidiendo --full-refresh.
+    """
+    name = "_".join(f"{f}_1" for f in fields)
+    current = collection.index_information().get(name)
+    if current is not None and not current.get("unique"):
+        collection.drop_index(name)
+    try:
+        collection.create_index([(f, ASCENDING) for f in fields], unique=True, name=name)
+    except OperationFailure as e:
+        raise RuntimeError(
+            f"{collection.name} tiene duplicados de ({', '.join(fields)}); "
+            "repite la ingesta con --full-refresh"
+        ) from e
+
+
+def insert_new(collection: Collection, docs: list[dict[str, Any]]) -> int:
+    """
+    insert_many sin orden que ignora las claves ya presentes (índice único): releer
+    filas de una ingesta anterior o de un reintento no las duplica. Devuelve las
+    insertadas.
+    """
+    try:
+        return len(collection.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if e.details.get("writeConcernErrors") or any(
+            err.get("code") != DUPLICATE_KEY for err in errors
+        ):
+            raise
+        return int(e.details.get("nInserted", 0))
+
+
+def movie_hash(movies: pd.DataFrame) -> pd.Series:
+    """Huella del contenido de cada película (título y géneros)."""
+    content = movies["title"].astype(str) + "\x1f" + movies["genres"].fillna("").astype(str)
+    return content.map(lambda s: hashlib.blake2b(s.encode(), digest_size=8).hexdigest())
+
+
+def ingest_ratings(
+    collection: Collection, watermark: int | None, chunk_size: int
+) -> tuple[int, int | None]:
+    """
+    Lee el staging de ratings por lotes de `chunk_size` filas y añade a `collection`
+    las que tienen `timestamp` >= `watermark` - settings.WATERMARK_LOOKBACK_S. El
+    margen recoge ratings tardíos o del mismo segundo que la marca; los ya presentes
+    los descarta el índice único. La memoria queda acotada por el tamaño de lote.
+    Devuelve (filas insertadas, máximo `timestamp` leído).
+    """
+    total = 0
+    max_key: int | None = None
+    for i, chunk in enumerate(iter_batches("ratings", chunk_size)):
+        t0 = time.perf_counter()
+        metrics.add_rows(rows_in=len(chunk))
+        if watermark is not None:
+            chunk = chunk[chunk["timestamp"] >= watermark - settings.WATERMARK_LOOKBACK_S]
+        if chunk.empty:
+            continue
+        n = insert_new(collection, chunk.to_dict(orient="records"))
+        chunk_max = int(chunk["timestamp"].max())
+        max_key = chunk_max if max_key is None else max(max_key, chunk_max)
+        total += n
+        metrics.add_rows(rows_out=n)
+        dt = time.perf_counter() - t0
+        rate = len(chunk) / dt if dt > 0 else 0.0
+        print(
+            f"  {collection.name} lote {i}: {n} nuevas de {len(chunk)} filas en {dt:.2f}s"
+            f" ({rate:,.0f} filas/s)"
+        )
+    return total, max_key
+
+
+def ingest_movies(collection: Collection, chunk_size: int) -> tuple[int, int | None]:
+    """
+    Upsert en `collection` de las películas nuevas o cuyo título/géneros cambiaron
+    (comparando la huella `hash` guardada). Cada una lleva `updated_at` (epoch en ms
+    de esta ingesta), que es lo que sigue la carga al warehouse. Devuelve (películas
+    escritas, `updated_at` usado o None si no cambió ninguna).
+    """
+    stamp = time.time_ns() // 1_000_000
+    known = {
+        d["movieId"]: d.get("hash")
+        for d in collection.find({}, {"_id": 0, "movieId": 1, "hash": 1})
+    }
+    total = 0
+    for chunk in iter_batches("movies", chunk_size):
+        metrics.add_rows(rows_in=len(chunk))
+        chunk = chunk.assign(hash=movie_hash(chunk))
+        chunk = chunk[[known.get(m) != h for m, h in zip(chunk["movieId"], chunk["hash"])]]
+        if chunk.empty:
+            continue
+        ops = [
+            ReplaceOne({"movieId": doc["movieId"]}, {**doc, "updated_at": stamp}, upsert=True)
+            for doc in chunk.to_dict(orient="records")
+        ]
+        collection.bulk_write(ops, ordered=False)
+        total += len(ops)
+        metrics.add_rows(rows_out=len(ops))
+    print(f"  {collection.name}: {total} películas nuevas o modificadas")
+    return total, stamp if total else None
+
+
+def main(full_refresh: bool = False, chunk_size: int | None = None) -> None:
+    """
+    Carga ratings y movies (Parquet o CSV en settings.DATA_DIR) a MongoDB
+    (colecciones ratings_raw y movies_raw).
+
+    Incremental por defecto: se añaden los ratings desde la marca de agua de
+    etl_state (menos settings.WATERMARK_LOOKBACK_S) sin duplicar los ya ingeridos, y
+    las películas nuevas o modificadas. Con `full_refresh` se vacían las colecciones
+    y se reinician las marcas de ingesta. Los ficheros se leen por lotes de
+    `chunk_size` filas (por defecto settings.INGEST_CHUNK_SIZE).
+    """
     client, db = get_mongo()
+    chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+
+    # Falla pronto (antes de tocar Mongo) si falta algún fichero de staging
+    resolve("ratings")
+    resolve("movies")
+
+    init_schema()
+    engine = get_engine()
 
-    ratings_csv = SAMPLES / "ratings.csv"
-    movies_csv = SAMPLES / "movies.csv"
+    if full_refresh:
+        db.ratings_raw.drop()
+        db.movies_raw.drop()
+        with engine.begin() as conn:
+            etl_state.reset_watermarks(conn, "ingest:")
 
-    if not ratings_csv.exists() or not movies_csv.exists():
-        raise FileNotFoundError("Coloca ratings.csv y movies.csv en data/samples/")
+    db.ratings_raw.create_index([("timestamp", ASCENDING)])
+    ensure_unique_index(db.ratings_raw, RATING_KEY)
+    ensure_unique_index(db.movies_raw, ["movieId"])
+    db.movies_raw.create_index([("updated_at", ASCENDING)])
 
-    ratings_df = pd.read_csv(ratings_csv)
-    movies_df = pd.read_csv(movies_csv)
+    with engine.begin() as conn:
+        ratings_wm = etl_state.get_watermark(conn, etl_state.INGEST_RATINGS)
+        ingested = etl_state.get_watermark(conn, etl_state.INGEST_ROWS) or 0
 
-    # Limpieza y carga
-    db.ratings_raw.drop()
-    db.movies_raw.drop()
+    # La marca avanza solo al terminar cada fichero (el staging no viene ordenado,
+    # así que no se puede avanzar lote a lote); si algo falla a medias, la siguiente
+    # ingesta relee desde la misma marca y el índice único descarta lo ya insertado.
+    n_ratings, ratings_max = ingest_ratings(db.ratings_raw, ratings_wm, chunk_size)
+    n_movies, movies_stamp = ingest_movies(db.movies_raw, chunk_size)
 
-    db.ratings_raw.insert_many(ratings_df.to_dict(orient="records"))
-    db.movies_raw.insert_many(movies_df.to_dict(orient="records"))
+    with engine.begin() as conn:
+        if ratings_max is not None:
+            etl_state.set_watermark(conn, etl_state.INGEST_RATINGS, ratings_max)
+        if movies_stamp is not None:
+            etl_state.set_watermark(conn, etl_state.INGEST_MOVIES, movies_stamp)
+        if n_ratings or n_movies:
+            etl_state.set_watermark(conn, etl_state.INGEST_ROWS, ingested + n_ratings + n_movies)
 
-    print(f"Insertados: ratings={len(ratings_df)} | movies={len(movies_df)}")
+    print(f"Insertados: ratings={n_ratings} | movies={n_movies}")
 
 
 if __name__ == "__main__":
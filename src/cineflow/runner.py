@@ -2,17 +2,30 @@
 from __future__ import annotations
 
 import argparse
+import cProfile
 import io
 import os
+import pstats
 import sys
 import time
 from contextlib import contextmanager
-from typing import Iterator, Optional, cast
+from pathlib import Path
+from typing import Callable, ContextManager, Iterator, Optional, cast
+
+from sqlalchemy import text
 
 from cineflow.dq.checks import validate_movies, validate_ratings
+from cineflow.dq.warehouse import validate_warehouse
+from cineflow.pipelines.build_similarity import main as step_similarity
 from cineflow.pipelines.ingest_raw import main as step_ingest
 from cineflow.pipelines.load_warehouse import main as step_load
-from cineflow.storage.postgres_admin import create_indexes_and_views
+from cineflow.scheduler import Stage, combine, file_hash, run_dag
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_admin import create_indexes, refresh_views
+from cineflow.storage.postgres_client import get_engine, init_schema
+from cineflow.storage.staging import resolve
+from cineflow.utils import metrics
+from cineflow.utils.config import settings
 
 
 def _supports_unicode() -> bool:
@@ -56,55 +69,201 @@ def timed(label: str) -> Iterator[None]:
         raise
 
 
-def run(only: Optional[str] = None, skip_validate: bool = False) -> None:
+@contextmanager
+def profiled(name: str, profile_dir: Optional[Path]) -> Iterator[None]:
+    """cProfile de la etapa (solo su hilo): vuelca `<dir>/<etapa>.prof` y muestra el top 10."""
+    if profile_dir is None:
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(profile_dir / f"{name}.prof")
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(10)
+        print(out.getvalue())
+
+
+def instrumented(
+    collected: list[metrics.StageMetrics], profile_dir: Optional[Path] = None
+) -> Callable[[Stage], ContextManager[None]]:
     """
-    Ejecuta el flujo completo. Flags:
-      - only: 'ingest' | 'validate' | 'load' | 'admin' (ejecuta solo esa etapa)
-      - skip_validate: salta validaciones DQ (útil en dev rápido)
+    Envoltorio de cada etapa para run_dag: tiempos, métricas y, si se pide, perfil.
+    Con perfil las etapas van en serie y el pico de RSS se mide por etapa.
     """
-    if only:
-        if only == "ingest":
-            with timed("Ingest (Mongo raw)"):
-                step_ingest()
-        elif only == "validate":
-            with timed("DQ ratings"):
-                validate_ratings()
-            with timed("DQ movies"):
-                validate_movies()
-        elif only == "load":
-            with timed(f"Load {SYMS['arrow']} Postgres"):
-                step_load()
-        elif only == "admin":
-            with timed("Postgres admin (índices & MV)"):
-                create_indexes_and_views()
-        else:
-            raise SystemExit(f"--only inválido: {only}")
-        return
+    serial = profile_dir is not None
 
-    # Flujo completo
-    with timed("Ingest (Mongo raw)"):
-        step_ingest()
+    @contextmanager
+    def wrap(stage: Stage) -> Iterator[None]:
+        with timed(stage.label):
+            with metrics.measure(stage.name, isolated_rss=serial) as m:
+                collected.append(m)
+                with profiled(stage.name, profile_dir):
+                    yield
+        print(f"  {SYMS['arrow']} {stage.name}: {m.summary()}")
+
+    return wrap
+
+
+def _watermarks(*sources: str) -> tuple[int | None, ...]:
+    with get_engine().connect() as conn:
+        return tuple(etl_state.get_watermark(conn, s) for s in sources)
+
+
+def _pending_days() -> int:
+    with get_engine().connect() as conn:
+        return int(conn.execute(text("SELECT COUNT(*) FROM etl_touched_dates")).scalar() or 0)
+
+
+def build_stages(full_refresh: bool = False, workers: Optional[int] = None) -> list[Stage]:
+    """
+    Grafo del pipeline. Ingesta y DQ del staging van en paralelo; la carga espera a
+    las tres; tras ella, la DQ del warehouse y los índices a la vez, y el refresco
+    de métricas tras la DQ (que lee la cola de días tocados que él vacía), en paralelo
+    con el cálculo de películas similares.
+    """
+    # LOAD_ROWS cambia con cada carga que inserta algo (también ratings tardíos)
+    load_wm = (etl_state.LOAD_RATINGS, etl_state.LOAD_MOVIES, etl_state.LOAD_ROWS)
+    return [
+        Stage(
+            "ingest",
+            "Ingest (Mongo raw)",
+            lambda: step_ingest(full_refresh=full_refresh),
+            fingerprint=lambda: combine(
+                file_hash(resolve("ratings")), file_hash(resolve("movies"))
+            ),
+        ),
+        Stage(
+            "dq_ratings",
+            "DQ ratings",
+            validate_ratings,
+            fingerprint=lambda: combine(file_hash(resolve("ratings")), settings.DQ_BLOOM_FP_RATE),
+        ),
+        Stage(
+            "dq_movies",
+            "DQ movies",
+            validate_movies,
+            fingerprint=lambda: combine(file_hash(resolve("movies"))),
+        ),
+        Stage(
+            "load",
+            f"Load {SYMS['arrow']} Postgres",
+            lambda: step_load(full_refresh=full_refresh, workers=workers),
+            deps=("ingest", "dq_ratings", "dq_movies"),
+            fingerprint=lambda: combine(
+                *_watermarks(
+                    etl_state.INGEST_RATINGS, etl_state.INGEST_MOVIES, etl_state.INGEST_ROWS
+                ),
+                settings.PG_PARTITIONED,
+            ),
+        ),
+        Stage(
+            "dq_warehouse",
+            "DQ warehouse",
+            validate_warehouse,
+            deps=("load",),
+            fingerprint=lambda: combine(*_watermarks(*load_wm)),
+        ),
+        Stage(
+            "admin_indexes",
+            "Postgres admin (índices)",
+            create_indexes,
+            deps=("load",),
+            fingerprint=lambda: combine(_regclass("fact_rating")),
+        ),
+        Stage(
+            "admin_views",
+            "Postgres admin (métricas diarias)",
+            refresh_views,
+            deps=("load", "dq_warehouse"),
+            fingerprint=lambda: combine(*_watermarks(*load_wm), _pending_days()),
+            record_after=True,
+        ),
+        Stage(
+            "similarity",
+            "Películas similares",
+            step_similarity,
+            deps=("load", "dq_warehouse"),
+            fingerprint=lambda: combine(
+                *_watermarks(*load_wm),
+                settings.SIMILAR_K,
+                settings.SIMILAR_MIN_RATINGS,
+            ),
+        ),
+    ]
+
+
+def _regclass(table: str) -> int | None:
+    with get_engine().connect() as conn:
+        oid = conn.execute(text("SELECT to_regclass(:t)::oid"), {"t": table}).scalar()
+    return None if oid is None else int(oid)
 
-    if not skip_validate:
-        with timed("DQ ratings"):
-            validate_ratings()
-        with timed("DQ movies"):
-            validate_movies()
-    else:
-        print(f"{SYMS['warn']} Validaciones DQ saltadas por --skip-validate")
 
-    with timed(f"Load {SYMS['arrow']} Postgres"):
-        step_load()
+ONLY = {
+    "ingest": ("ingest",),
+    "validate": ("dq_ratings", "dq_movies"),
+    "load": ("load",),
+    "dq-warehouse": ("dq_warehouse",),
+    "admin": ("admin_indexes", "admin_views"),
+    "similarity": ("similarity",),
+}
+
 
-    with timed("Postgres admin (índices & MV)"):
-        create_indexes_and_views()
+def run(
+    only: Optional[str] = None,
+    skip_validate: bool = False,
+    full_refresh: bool = False,
+    workers: Optional[int] = None,
+    force: bool = False,
+    metrics_path: Optional[str] = None,
+    profile_dir: Optional[str] = None,
+    trace_sql: bool = False,
+) -> dict[str, str]:
+    """
+    Ejecuta el pipeline como grafo de etapas (ver build_stages). Flags:
+      - only: 'ingest' | 'validate' | 'load' | 'dq-warehouse' | 'admin' | 'similarity'
+        (solo esa etapa, siempre se ejecuta)
+      - skip_validate: salta validaciones DQ (útil en dev rápido)
+      - full_refresh: ignora las marcas de agua y reconstruye raw y warehouse
+      - workers: procesos para la carga a Postgres (tramos de timestamp)
+      - force: ejecuta las etapas aunque sus entradas no hayan cambiado
+      - metrics_path: fichero de métricas por etapa (por defecto settings.METRICS_FILE)
+      - profile_dir: cProfile por etapa en ese directorio (las etapas van de una en una)
+      - trace_sql: imprime cada sentencia SQL con su duración y filas
+    Devuelve el estado de cada etapa (ran / skipped / failed / blocked).
+    """
+    metrics.install(trace_sql=trace_sql)
+    init_schema()
+    stages = build_stages(full_refresh=full_refresh, workers=workers)
+    if only:
+        if only not in ONLY:
+            raise SystemExit(f"--only inválido: {only}")
+        stages = [s for s in stages if s.name in ONLY[only]]
+        force = True
+    elif skip_validate:
+        print(f"{SYMS['warn']} Validaciones DQ saltadas por --skip-validate")
+        stages = [s for s in stages if not s.name.startswith("dq_")]
+    collected: list[metrics.StageMetrics] = []
+    wrap = instrumented(collected, Path(profile_dir) if profile_dir else None)
+    # cProfile solo admite un perfilador activo a la vez (Python >= 3.12)
+    max_workers = 1 if profile_dir else 4
+    metrics_path = metrics_path or settings.METRICS_FILE
+    try:
+        return run_dag(stages, wrap, force=force or full_refresh, max_workers=max_workers)
+    finally:
+        if metrics_path and collected:
+            metrics.write(metrics_path, collected)
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="CineFlow runner")
     parser.add_argument(
         "--only",
-        choices=["ingest", "validate", "load", "admin"],
+        choices=list(ONLY),
         help="Ejecuta solo una etapa",
     )
     parser.add_argument(
@@ -112,10 +271,53 @@ def main() -> None:
         action="store_true",
         help="Salta validaciones DQ",
     )
+    parser.add_argument(
+        "--full-refresh",
+        action="store_true",
+        help="Ignora las marcas de agua: recarga raw y warehouse desde cero",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Procesos para la carga a Postgres (tramos de timestamp)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ejecuta todas las etapas aunque sus entradas no hayan cambiado",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="Métricas por etapa: *.prom (textfile de Prometheus) o JSON lines",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profiles",
+        metavar="DIR",
+        help="cProfile de cada etapa en DIR/<etapa>.prof (por defecto ./profiles)",
+    )
+    parser.add_argument(
+        "--trace-sql",
+        action="store_true",
+        help="Imprime cada sentencia SQL con su duración",
+    )
     args = parser.parse_args()
     t0 = time.perf_counter()
     try:
-        run(only=args.only, skip_validate=args.skip_validate)
+        run(
+            only=args.only,
+            skip_validate=args.skip_validate,
+            full_refresh=args.full_refresh,
+            workers=args.workers,
+            force=args.force,
+            metrics_path=args.metrics,
+            profile_dir=args.profile,
+            trace_sql=args.trace_sql,
+        )
         dt = time.perf_counter() - t0
         print(f"\n{SYMS['done']} Pipeline completo OK en {dt:.2f}s")
     except Exception:
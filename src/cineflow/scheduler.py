@@ -0,0 +1,142 @@
+"""Ejecución de las etapas del pipeline como grafo de dependencias, con omisión por huella."""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, ContextManager, Iterable, Sequence
+
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_client import get_engine
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    Etapa del grafo. `fingerprint` resume sus entradas (hashes de ficheros, marcas
+    de agua...): si coincide con la de la última ejecución correcta la etapa se
+    omite. Sin `fingerprint` se ejecuta siempre. Con `record_after` la huella se
+    toma al terminar, para etapas que consumen parte de su propia entrada (p. ej.
+    vaciar la cola de días tocados).
+    """
+
+    name: str
+    label: str
+    run: Callable[[], object]
+    deps: tuple[str, ...] = ()
+    fingerprint: Callable[[], str] | None = None
+    record_after: bool = False
+
+
+# Estado final de cada etapa en run_dag
+RAN, SKIPPED, FAILED, BLOCKED = "ran", "skipped", "failed", "blocked"
+
+_HASHES: dict[tuple[str, int, int], str] = {}
+_HASHES_LOCK = threading.Lock()
+
+
+def file_hash(path: Path) -> str:
+    """blake2b del contenido; se recuerda por (ruta, tamaño, mtime) dentro del proceso."""
+    st = path.stat()
+    key = (str(path.resolve()), st.st_size, st.st_mtime_ns)
+    with _HASHES_LOCK:
+        cached = _HASHES.get(key)
+    if cached is None:
+        with path.open("rb") as f:
+            cached = hashlib.file_digest(f, "blake2b").hexdigest()
+        with _HASHES_LOCK:
+            _HASHES[key] = cached
+    return cached
+
+
+def combine(*parts: object) -> str:
+    """Huella estable a partir de varios valores."""
+    return hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=16).hexdigest()
+
+
+def _execute(stage: Stage, force: bool, wrap: Callable[[Stage], ContextManager[None]]) -> str:
+    fp = stage.fingerprint() if stage.fingerprint else None
+    if fp is not None and not force:
+        with get_engine().connect() as conn:
+            if etl_state.get_stage_fingerprint(conn, stage.name) == fp:
+                print(f"= {stage.label}: sin cambios, se omite\n", end="", flush=True)
+                return SKIPPED
+    t0 = time.perf_counter()
+    with wrap(stage):
+        stage.run()
+    if stage.fingerprint is not None:
+        if stage.record_after or fp is None:
+            fp = stage.fingerprint()
+        with get_engine().begin() as conn:
+            etl_state.record_stage_run(conn, stage.name, fp, time.perf_counter() - t0)
+    return RAN
+
+
+def run_dag(
+    stages: Sequence[Stage],
+    wrap: Callable[[Stage], ContextManager[None]],
+    force: bool = False,
+    max_workers: int = 4,
+) -> dict[str, str]:
+    """
+    Ejecuta `stages` en paralelo respetando `deps` (las que no están en `stages` se
+    dan por satisfechas). Si una etapa falla, las que dependen de ella quedan
+    bloqueadas y el resto sigue; al final se relanza el primer error.
+    Devuelve el estado de cada etapa (ran / skipped / failed / blocked).
+    """
+    order(stages)
+    names = {s.name for s in stages}
+    pending = {s.name: s for s in stages}
+    status: dict[str, str] = {}
+    errors: list[BaseException] = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        running: dict[Future[str], Stage] = {}
+        while pending or running:
+            for stage in list(pending.values()):
+                deps = [d for d in stage.deps if d in names]
+                if any(status.get(d) in (FAILED, BLOCKED) for d in deps):
+                    status[stage.name] = BLOCKED
+                    del pending[stage.name]
+                elif all(d in status for d in deps):
+                    running[pool.submit(_execute, stage, force, wrap)] = stage
+                    del pending[stage.name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    status[stage.name] = future.result()
+                except Exception as e:
+                    status[stage.name] = FAILED
+                    errors.append(e)
+    if errors:
+        raise errors[0]
+    return status
+
+
+def order(stages: Iterable[Stage]) -> list[str]:
+    """Orden topológico de las etapas; falla si el grafo tiene ciclos."""
+    by_name = {s.name: s for s in stages}
+    seen: dict[str, bool] = {}
+    out: list[str] = []
+
+    def visit(name: str) -> None:
+        if seen.get(name) is False:
+            raise ValueError(f"Ciclo en el grafo de etapas en {name}")
+        if name in seen:
+            return
+        seen[name] = False
+        for dep in by_name[name].deps:
+            if dep in by_name:
+                visit(dep)
+        seen[name] = True
+        out.append(name)
+
+    for name in by_name:
+        visit(name)
+    return out
@@ -0,0 +1,108 @@
+"""Estado persistente del ETL (marcas de agua por fuente) en la tabla etl_state."""
+
+from __future__ import annotations
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Fuentes conocidas: <etapa>:<entidad>
+INGEST_RATINGS = "ingest:ratings"  # max(timestamp) ya insertado en ratings_raw
+INGEST_MOVIES = "ingest:movies"  # max(updated_at) escrito en movies_raw
+INGEST_ROWS = "ingest:rows"  # documentos insertados en raw (acumulado; cambia con cada ingesta)
+LOAD_RATINGS = "load:ratings"  # max(timestamp) ya cargado en fact_rating
+LOAD_MOVIES = "load:movies"  # max(updated_at) de movies_raw ya cargado en dim_movie
+LOAD_ROWS = "load:rows"  # filas nuevas en el warehouse (acumulado; cambia con cada carga)
+REMOVED_ROWS = "load:removed"  # ratings sacados de fact_rating con purge/detach (acumulado)
+GENERATION = "warehouse:generation"  # contador que sube tras cada carga/refresh con éxito
+
+# Canal LISTEN/NOTIFY por el que se anuncia cada nueva generación del warehouse
+GENERATION_CHANNEL = "cineflow_generation"
+
+
+def get_watermark(conn: Connection, source: str) -> int | None:
+    """Devuelve la marca de agua de `source` o None si nunca se procesó."""
+    row = conn.execute(
+        text("SELECT watermark FROM etl_state WHERE source = :source"), {"source": source}
+    ).first()
+    return None if row is None else int(row[0])
+
+
+def set_watermark(conn: Connection, source: str, value: int) -> None:
+    """Avanza la marca de agua de `source` (nunca retrocede)."""
+    conn.execute(
+        text("""
+        INSERT INTO etl_state(source, watermark) VALUES (:source, :value)
+        ON CONFLICT (source) DO UPDATE
+        SET watermark = GREATEST(etl_state.watermark, EXCLUDED.watermark), updated_at = now();
+    """),
+        {"source": source, "value": int(value)},
+    )
+
+
+def add_counter(conn: Connection, source: str, n: int) -> int:
+    """
+    Suma `n` al contador `source` y devuelve el total. A diferencia de la marca de
+    agua, cambia aunque lo cargado quede por debajo del máximo ya visto.
+    """
+    total = conn.execute(
+        text("""
+        INSERT INTO etl_state(source, watermark) VALUES (:source, :n)
+        ON CONFLICT (source) DO UPDATE
+        SET watermark = etl_state.watermark + EXCLUDED.watermark, updated_at = now()
+        RETURNING watermark;
+    """),
+        {"source": source, "n": int(n)},
+    ).scalar_one()
+    return int(total)
+
+
+def get_generation(conn: Connection) -> int:
+    """Generación actual del warehouse (0 si nunca se cargó)."""
+    return get_watermark(conn, GENERATION) or 0
+
+
+def bump_generation(conn: Connection) -> int:
+    """
+    Incrementa la generación del warehouse y la notifica por GENERATION_CHANNEL.
+    El NOTIFY se entrega al hacer commit, junto con los datos de la carga.
+    """
+    gen = conn.execute(
+        text("""
+        INSERT INTO etl_state(source, watermark) VALUES (:source, 1)
+        ON CONFLICT (source) DO UPDATE
+        SET watermark = etl_state.watermark + 1, updated_at = now()
+        RETURNING watermark;
+    """),
+        {"source": GENERATION},
+    ).scalar_one()
+    conn.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": GENERATION_CHANNEL, "payload": str(gen)},
+    )
+    return int(gen)
+
+
+def get_stage_fingerprint(conn: Connection, stage: str) -> str | None:
+    """Huella de entradas con la que `stage` terminó bien la última vez (None si nunca)."""
+    row = conn.execute(
+        text("SELECT fingerprint FROM etl_stage_runs WHERE stage = :stage"), {"stage": stage}
+    ).first()
+    return None if row is None else str(row[0])
+
+
+def record_stage_run(conn: Connection, stage: str, fingerprint: str, seconds: float) -> None:
+    conn.execute(
+        text("""
+        INSERT INTO etl_stage_runs(stage, fingerprint, seconds) VALUES (:stage, :fp, :seconds)
+        ON CONFLICT (stage) DO UPDATE
+        SET fingerprint = EXCLUDED.fingerprint, seconds = EXCLUDED.seconds, finished_at = now();
+    """),
+        {"stage": stage, "fp": fingerprint, "seconds": seconds},
+    )
+
+
+def reset_watermarks(conn: Connection, prefix: str) -> None:
+    """Borra las marcas de agua cuyo `source` empieza por `prefix` (p. ej. 'load:')."""
+    conn.execute(
+        text("DELETE FROM etl_state WHERE source LIKE :pattern"), {"pattern": f"{prefix}%"}
+    )
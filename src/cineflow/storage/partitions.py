@@ -0,0 +1,210 @@
+"""Particionado opcional de fact_rating por rangos de rating_date (PG_PARTITIONED)."""
+
+from __future__ import annotations
+
+import argparse
+import re
+from datetime import date, datetime, timezone
+from typing import Iterator, List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_admin import MOVIE_DAILY_STATS_SELECT, rebuild_movie_stats
+from cineflow.storage.postgres_client import get_engine
+from cineflow.utils.config import settings
+
+GRANULARITIES = ("month", "year")
+PARENT = "fact_rating"
+_BOUND = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def is_partitioned(conn: Connection) -> bool:
+    """True si fact_rating existe y es una tabla particionada."""
+    kind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": PARENT}
+    ).scalar()
+    return kind == "p"
+
+
+def period(day: date, granularity: str) -> tuple[date, date, str]:
+    """Rango [inicio, fin) y nombre de la partición que contiene `day`."""
+    if granularity == "month":
+        start = day.replace(day=1)
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        return start, end, f"{PARENT}_p{start:%Y%m}"
+    if granularity == "year":
+        start = date(day.year, 1, 1)
+        return start, date(day.year + 1, 1, 1), f"{PARENT}_p{start:%Y}"
+    raise ValueError(f"Granularidad desconocida: {granularity} (usa {', '.join(GRANULARITIES)})")
+
+
+def iter_periods(lo: date, hi: date, granularity: str) -> Iterator[tuple[date, date, str]]:
+    """Periodos consecutivos que cubren [lo, hi]."""
+    start, end, name = period(lo, granularity)
+    while start <= hi:
+        yield start, end, name
+        start, end, name = period(end, granularity)
+
+
+def list_partitions(conn: Connection) -> list[tuple[str, date, date]]:
+    """Particiones de fact_rating como (nombre, inicio, fin), ordenadas por inicio."""
+    rows = conn.execute(
+        text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:t)
+    """),
+        {"t": PARENT},
+    ).all()
+    parts = []
+    for name, bound in rows:
+        m = _BOUND.search(bound or "")
+        if m:
+            parts.append((name, date.fromisoformat(m.group(1)), date.fromisoformat(m.group(2))))
+    return sorted(parts, key=lambda p: p[1])
+
+
+def ensure_partitions(
+    conn: Connection, lo_ts: int, hi_ts: int, granularity: str | None = None
+) -> List[str]:
+    """
+    Crea las particiones que faltan para cubrir los timestamps [lo_ts, hi_ts].
+    Un periodo ya cubierto por una partición existente (p. ej. un año cuando ahora
+    se pide por meses) no se vuelve a crear. Devuelve los nombres creados.
+
+    Se llama desde el proceso principal antes de repartir la carga: crear una
+    partición bloquea la tabla padre y los workers ya estarían insertando en ella.
+    """
+    granularity = granularity or settings.PG_PARTITION_GRANULARITY
+    existing = list_partitions(conn)
+    lo = datetime.fromtimestamp(lo_ts, tz=timezone.utc).date()
+    hi = datetime.fromtimestamp(hi_ts, tz=timezone.utc).date()
+    created = []
+    for start, end, name in iter_periods(lo, hi, granularity):
+        if any(s <= start and end <= e for _, s, e in existing):
+            continue
+        conn.execute(
+            text(f"""
+            CREATE TABLE {name} PARTITION OF {PARENT}
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+        """)
+        )
+        created.append(name)
+    return created
+
+
+def _bounds(conn: Connection, name: str) -> tuple[date, date]:
+    for part, start, end in list_partitions(conn):
+        if part == name:
+            return start, end
+    raise ValueError(f"{name} no es una partición de {PARENT}")
+
+
+def _count(conn: Connection, name: str) -> int:
+    return int(conn.execute(text(f"SELECT COUNT(*) FROM {name}")).scalar_one())
+
+
+def resync_aggregates(conn: Connection, start: date, end: date) -> None:
+    """
+    Pone al día los agregados de fact_rating tras cambiar a mano los días [start, end)
+    (ATTACH/DETACH): movie_stats entera, movie_daily_stats de ese tramo, y los días
+    quedan en etl_touched_dates para que la etapa admin recalcule daily_metrics.
+    """
+    params = {"start": start, "end": end}
+    rebuild_movie_stats(conn)
+    conn.execute(
+        text("DELETE FROM movie_daily_stats WHERE rating_date >= :start AND rating_date < :end"),
+        params,
+    )
+    conn.execute(
+        text(f"""
+        INSERT INTO movie_daily_stats(movie_id, rating_date, ratings, rating_sum)
+        SELECT * FROM ({MOVIE_DAILY_STATS_SELECT}) d
+        WHERE d.rating_date >= :start AND d.rating_date < :end;
+    """),
+        params,
+    )
+    conn.execute(
+        text("""
+        INSERT INTO etl_touched_dates(rating_date)
+        SELECT d::date
+        FROM generate_series(CAST(:start AS timestamp), CAST(:end AS timestamp) - interval '1 day',
+                             interval '1 day') d
+        ON CONFLICT DO NOTHING;
+    """),
+        params,
+    )
+
+
+def detach_partition(conn: Connection, name: str) -> None:
+    """
+    Separa una partición: sus filas dejan de verse en fact_rating al instante y los
+    agregados se ajustan en la misma transacción (daily_metrics en la etapa admin).
+    Sus filas se suman a REMOVED_ROWS, que raw_drift descuenta de Mongo raw.
+    """
+    start, end = _bounds(conn, name)
+    etl_state.add_counter(conn, etl_state.REMOVED_ROWS, _count(conn, name))
+    conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name};"))
+    resync_aggregates(conn, start, end)
+
+
+def attach_partition(conn: Connection, name: str, start: date, end: date) -> None:
+    """Vuelve a colgar una tabla con el mismo esquema como partición [start, end)."""
+    etl_state.add_counter(conn, etl_state.REMOVED_ROWS, -_count(conn, name))
+    conn.execute(
+        text(f"""
+        ALTER TABLE {PARENT} ATTACH PARTITION {name}
+        FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}');
+    """)
+    )
+    resync_aggregates(conn, start, end)
+
+
+def purge_before(conn: Connection, cutoff: date) -> List[str]:
+    """
+    Elimina las particiones que terminan antes de `cutoff` (DETACH + DROP, sin un
+    DELETE fila a fila) y ajusta los agregados que dependen de fact_rating. Si
+    `cutoff` cae dentro de una partición, esa se conserva entera (y sus días en los
+    agregados). Devuelve los nombres eliminados.
+    """
+    dropped = []
+    horizon = None
+    for name, _, end in list_partitions(conn):
+        if end <= cutoff:
+            etl_state.add_counter(conn, etl_state.REMOVED_ROWS, _count(conn, name))
+            conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name};"))
+            conn.execute(text(f"DROP TABLE {name};"))
+            dropped.append(name)
+            horizon = end if horizon is None else max(horizon, end)
+    if dropped:
+        # Solo los días de las particiones borradas: el resto sigue en fact_rating
+        rebuild_movie_stats(conn)
+        conn.execute(text("DELETE FROM daily_metrics WHERE rating_date < :h"), {"h": horizon})
+        conn.execute(text("DELETE FROM movie_daily_stats WHERE rating_date < :h"), {"h": horizon})
+    return dropped
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Particiones de fact_rating")
+    parser.add_argument(
+        "--purge-before", type=date.fromisoformat, metavar="YYYY-MM-DD", default=None
+    )
+    args = parser.parse_args(argv)
+
+    with get_engine().begin() as conn:
+        if not is_partitioned(conn):
+            raise SystemExit("fact_rating no está particionada (PG_PARTITIONED=false)")
+        if args.purge_before is not None:
+            dropped = purge_before(conn, args.purge_before)
+            if dropped:
+                etl_state.bump_generation(conn)
+            print(f"[PG] Particiones eliminadas: {', '.join(dropped) or 'ninguna'}")
+        for name, start, end in list_partitions(conn):
+            print(f"  {name}: [{start}, {end})")
+
+
+if __name__ == "__main__":
+    main()
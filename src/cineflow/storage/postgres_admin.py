@@ -1,11 +1,204 @@
 from sqlalchemy import text
+from sqlalchemy.engine import Connection
 
-from cineflow.storage.postgres_client import get_engine
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_client import get_engine, init_schema
+from cineflow.utils import metrics
 
+MOVIE_STATS_SELECT = """
+    SELECT movie_id,
+           COUNT(*) AS ratings,
+           SUM(rating) AS rating_sum,
+           ROUND(AVG(rating)::numeric, 2) AS avg_rating
+    FROM fact_rating
+    GROUP BY movie_id
+"""
 
-def create_indexes_and_views() -> None:
-    engine = get_engine()
-    with engine.begin() as conn:
+MOVIE_DAILY_STATS_SELECT = """
+    SELECT movie_id, rating_date, COUNT(*) AS ratings, SUM(rating) AS rating_sum
+    FROM fact_rating
+    GROUP BY movie_id, rating_date
+"""
+
+DAILY_METRICS_SELECT = """
+    SELECT rating_date,
+           COUNT(*)::int AS ratings_cnt,
+           COUNT(DISTINCT user_id)::int AS users_active,
+           ROUND(AVG(rating)::numeric, 3) AS avg_rating
+    FROM fact_rating
+"""
+
+
+def ensure_movie_stats(conn: Connection) -> None:
+    """
+    Crea movie_stats (agregado por película: nº de ratings, suma y media) y, si es
+    nueva, la rellena desde fact_rating en la misma transacción. A partir de ahí la
+    mantiene load_warehouse de forma incremental con las filas que inserta.
+    """
+    conn.execute(
+        text(f"""
+        DO $$
+        BEGIN
+          IF to_regclass('movie_stats') IS NULL THEN
+            CREATE TABLE movie_stats (
+                movie_id INTEGER PRIMARY KEY,
+                ratings BIGINT NOT NULL,
+                rating_sum DOUBLE PRECISION NOT NULL,
+                avg_rating NUMERIC(6, 2) NOT NULL
+            );
+            INSERT INTO movie_stats(movie_id, ratings, rating_sum, avg_rating)
+            {MOVIE_STATS_SELECT};
+          END IF;
+        END $$;
+    """)
+    )
+    conn.execute(
+        text("""
+        CREATE INDEX IF NOT EXISTS idx_movie_stats_rank
+        ON movie_stats (avg_rating DESC, ratings DESC);
+    """)
+    )
+
+
+def ensure_movie_daily_stats(conn: Connection) -> None:
+    """
+    Crea movie_daily_stats (ratings y suma por película y día, la base del índice
+    temporal de analytics.time_index) y, si es nueva, la rellena desde fact_rating.
+    Como movie_stats, la mantiene load_warehouse con las filas que inserta, a través
+    de la cola etl_pending_stats donde cada worker de carga deja sus deltas.
+    """
+    conn.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS etl_pending_stats (
+            movie_id INTEGER NOT NULL,
+            rating_date DATE NOT NULL,
+            ratings INTEGER NOT NULL,
+            rating_sum DOUBLE PRECISION NOT NULL
+        );
+    """)
+    )
+    conn.execute(
+        text(f"""
+        DO $$
+        BEGIN
+          IF to_regclass('movie_daily_stats') IS NULL THEN
+            CREATE TABLE movie_daily_stats (
+                movie_id INTEGER NOT NULL,
+                rating_date DATE NOT NULL,
+                ratings INTEGER NOT NULL,
+                rating_sum DOUBLE PRECISION NOT NULL,
+                PRIMARY KEY (movie_id, rating_date)
+            );
+            INSERT INTO movie_daily_stats(movie_id, rating_date, ratings, rating_sum)
+            {MOVIE_DAILY_STATS_SELECT};
+          END IF;
+        END $$;
+    """)
+    )
+
+
+def ensure_genre_stats(conn: Connection) -> None:
+    """
+    Vista genre_stats: agrega movie_stats por género a través de bridge_movie_genre
+    (unas decenas de géneros × miles de películas; no toca fact_rating).
+    """
+    conn.execute(
+        text("""
+        CREATE OR REPLACE VIEW genre_stats AS
+        SELECT g.genre_id,
+               g.name AS genre,
+               SUM(s.ratings)::bigint AS total_ratings,
+               ROUND((SUM(s.rating_sum) / SUM(s.ratings))::numeric, 2) AS avg_rating
+        FROM dim_genre g
+        JOIN bridge_movie_genre b ON b.genre_id = g.genre_id
+        JOIN movie_stats s ON s.movie_id = b.movie_id
+        GROUP BY g.genre_id, g.name;
+    """)
+    )
+
+
+def ensure_daily_metrics(conn: Connection) -> None:
+    """
+    Crea daily_metrics (una fila por rating_date, sustituye a mv_daily_metrics) y la
+    cola etl_touched_dates, donde la carga apunta los días a los que añadió ratings.
+    Si la tabla es nueva se rellena entera desde fact_rating.
+    """
+    conn.execute(
+        text("""
+        CREATE TABLE IF NOT EXISTS etl_touched_dates (
+            rating_date DATE PRIMARY KEY
+        );
+    """)
+    )
+    conn.execute(
+        text(f"""
+        DO $$
+        BEGIN
+          IF to_regclass('daily_metrics') IS NULL THEN
+            CREATE TABLE daily_metrics (
+                rating_date DATE PRIMARY KEY,
+                ratings_cnt INTEGER NOT NULL,
+                users_active INTEGER NOT NULL,
+                avg_rating NUMERIC(6, 3) NOT NULL
+            );
+            INSERT INTO daily_metrics(rating_date, ratings_cnt, users_active, avg_rating)
+            {DAILY_METRICS_SELECT}
+            GROUP BY rating_date;
+          END IF;
+        END $$;
+    """)
+    )
+    conn.execute(text("DROP MATERIALIZED VIEW IF EXISTS mv_daily_metrics;"))
+
+
+def refresh_daily_metrics(conn: Connection) -> int:
+    """
+    Recalcula en daily_metrics solo los días pendientes en etl_touched_dates y vacía
+    la cola. users_active (COUNT DISTINCT) no es sumable, así que cada día tocado se
+    recalcula entero desde fact_rating (índice por rating_date). Los lectores siguen
+    viendo la versión anterior hasta el commit: no hay bloqueo como en un REFRESH.
+    Devuelve el número de días recalculados.
+    """
+    touched = conn.execute(text("DELETE FROM etl_touched_dates RETURNING rating_date;"))
+    days = touched.scalars().all()
+    if not days:
+        return 0
+    params = {"days": list(days)}
+    conn.execute(text("DELETE FROM daily_metrics WHERE rating_date = ANY(:days);"), params)
+    conn.execute(
+        text(f"""
+        INSERT INTO daily_metrics(rating_date, ratings_cnt, users_active, avg_rating)
+        {DAILY_METRICS_SELECT}
+        WHERE rating_date = ANY(:days)
+        GROUP BY rating_date;
+    """),
+        params,
+    )
+    return len(days)
+
+
+def ensure_aggregates(conn: Connection) -> None:
+    """Tablas y vistas agregadas que leen la API y el dashboard."""
+    ensure_movie_stats(conn)
+    ensure_movie_daily_stats(conn)
+    ensure_genre_stats(conn)
+    ensure_daily_metrics(conn)
+
+
+def rebuild_movie_stats(conn: Connection) -> None:
+    """Recalcula movie_stats completa desde fact_rating (tras purgas o reparaciones)."""
+    conn.execute(text("TRUNCATE movie_stats;"))
+    conn.execute(
+        text(f"""
+        INSERT INTO movie_stats(movie_id, ratings, rating_sum, avg_rating)
+        {MOVIE_STATS_SELECT};
+    """)
+    )
+
+
+def create_indexes() -> None:
+    """Índices secundarios de fact_rating (en la tabla padre si está particionada)."""
+    with get_engine().begin() as conn:
         conn.execute(
             text("CREATE INDEX IF NOT EXISTS idx_fact_rating_date ON fact_rating(rating_date);")
         )
@@ -13,21 +206,25 @@ def create_indexes_and_views() -> None:
             text("CREATE INDEX IF NOT EXISTS idx_fact_rating_movie ON fact_rating(movie_id);")
         )
 
-        conn.execute(
-            text("""
-            CREATE MATERIALIZED VIEW IF NOT EXISTS mv_daily_metrics AS
-            SELECT
-              rating_date,
-              COUNT(*)::int AS ratings_cnt,
-              COUNT(DISTINCT user_id)::int AS users_active,
-              ROUND(AVG(rating)::numeric, 3) AS avg_rating
-            FROM fact_rating
-            GROUP BY rating_date
-            ORDER BY rating_date;
-        """)
-        )
+
+def refresh_views() -> int:
+    """Agregados al día y refresco incremental de daily_metrics (días recalculados)."""
+    with get_engine().begin() as conn:
+        ensure_aggregates(conn)
+        days = refresh_daily_metrics(conn)
+        if days:
+            etl_state.bump_generation(conn)
+    metrics.add_rows(rows_out=days)
+    print(f"daily_metrics: {days} días recalculados")
+    return days
+
+
+def create_indexes_and_views() -> int:
+    init_schema()
+    create_indexes()
+    return refresh_views()
 
 
 if __name__ == "__main__":
     create_indexes_and_views()
-    print("[PG] Índices y MV creados")
+    print("[PG] Índices y métricas diarias al día")
@@ -0,0 +1,61 @@
+"""Engine asíncrono (SQLAlchemy asyncio + asyncpg) para la API."""
+
+from __future__ import annotations
+
+import asyncio
+import weakref
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from cineflow.storage.postgres_client import database_url, pool_options
+from cineflow.utils.config import settings
+
+# Un engine por event loop: las conexiones asyncpg quedan ligadas al loop que las
+# creó. En producción hay un único loop por proceso (uvicorn); el TestClient sin
+# lifespan abre un loop por petición y así no reutiliza conexiones de otro loop.
+_ENGINES: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncEngine] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_engine() -> AsyncEngine:
+    """Engine asyncpg compartido dentro del event loop actual (mismo pool que Settings.PG_*)."""
+    loop = asyncio.get_running_loop()
+    engine = _ENGINES.get(loop)
+    if engine is None:
+        connect_args: dict[str, Any] = {}
+        if settings.PG_STATEMENT_TIMEOUT_MS > 0:
+            connect_args["server_settings"] = {
+                "statement_timeout": str(settings.PG_STATEMENT_TIMEOUT_MS)
+            }
+        engine = create_async_engine(
+            database_url("asyncpg"), connect_args=connect_args, **pool_options()
+        )
+        _ENGINES[loop] = engine
+    return engine
+
+
+async def dispose_async_engine() -> None:
+    """Cierra el pool del loop actual (shutdown de la API)."""
+    engine = _ENGINES.pop(asyncio.get_running_loop(), None)
+    if engine is not None:
+        await engine.dispose()
+
+
+def async_pool_stats() -> list[dict[str, Any]]:
+    """Estado de los pools asyncpg vivos del proceso."""
+    stats = []
+    for engine in list(_ENGINES.values()):
+        pool: Any = engine.pool
+        stats.append(
+            {
+                "url": engine.url.render_as_string(hide_password=True),
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": settings.PG_MAX_OVERFLOW,
+            }
+        )
+    return stats
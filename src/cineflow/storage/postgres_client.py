@@ -1,12 +1,131 @@
+import io
+import os
+import threading
+from typing import Any, Sequence
+
+import pandas as pd
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
 
+from cineflow.utils import metrics
 from cineflow.utils.config import settings
 
+# Registro de engines del proceso: uno por (pid, url). El pid evita reutilizar en un
+# proceso hijo (fork) el pool de conexiones heredado del padre.
+_ENGINES: dict[tuple[int, str], Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def database_url(driver: str | None = "psycopg2") -> str:
+    """URL de Postgres; `driver=None` da el DSN libpq plano (postgresql://...)."""
+    scheme = f"postgresql+{driver}" if driver else "postgresql"
+    return (
+        f"{scheme}://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
+        f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
+    )
+
+
+def pool_options() -> dict[str, Any]:
+    """Parámetros de pool comunes a los engines sync y async (ver Settings.PG_*)."""
+    return {
+        "pool_size": settings.PG_POOL_SIZE,
+        "max_overflow": settings.PG_MAX_OVERFLOW,
+        "pool_recycle": settings.PG_POOL_RECYCLE_S,
+        "pool_timeout": settings.PG_POOL_TIMEOUT_S,
+        "pool_pre_ping": True,
+    }
+
 
 def get_engine() -> Engine:
-    url = f"postgresql+psycopg2://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB}"
-    return create_engine(url, pool_pre_ping=True)
+    """Engine compartido del proceso (API, dashboard, pipelines y admin usan el mismo pool)."""
+    url = database_url()
+    key = (os.getpid(), url)
+    engine = _ENGINES.get(key)
+    if engine is not None:
+        return engine
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            connect_args = {}
+            if settings.PG_STATEMENT_TIMEOUT_MS > 0:
+                connect_args["options"] = f"-c statement_timeout={settings.PG_STATEMENT_TIMEOUT_MS}"
+            engine = create_engine(url, connect_args=connect_args, **pool_options())
+            _ENGINES[key] = engine
+    return engine
+
+
+def pool_stats() -> list[dict[str, Any]]:
+    """Estado de los pools del proceso, para dimensionarlos bajo carga."""
+    pid = os.getpid()
+    stats = []
+    for (owner, _), engine in list(_ENGINES.items()):
+        if owner != pid:
+            continue
+        pool: Any = engine.pool
+        stats.append(
+            {
+                "url": engine.url.render_as_string(hide_password=True),
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": settings.PG_MAX_OVERFLOW,
+            }
+        )
+    return stats
+
+
+def dispose_engines() -> None:
+    """Cierra los pools del proceso (al apagar la API o entre benchmarks)."""
+    with _ENGINES_LOCK:
+        for key, engine in list(_ENGINES.items()):
+            if key[0] == os.getpid():
+                engine.dispose()
+                del _ENGINES[key]
+
+
+def copy_dataframe(conn: Connection, df: pd.DataFrame, table: str, columns: Sequence[str]) -> int:
+    """Vuelca `df[columns]` a `table` con COPY FROM STDIN (CSV) dentro de la transacción."""
+    buf = io.StringIO()
+    df.to_csv(buf, columns=list(columns), index=False, header=False)
+    metrics.add_db("postgres", sent=buf.tell())  # COPY va por el cursor DBAPI, sin listeners
+    buf.seek(0)
+    cols = ", ".join(columns)
+    cursor = conn.connection.dbapi_connection.cursor()  # type: ignore[union-attr]
+    try:
+        cursor.copy_expert(f"COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+    return len(df)
+
+
+def fact_rating_ddl() -> str:
+    """
+    DDL de fact_rating. Con PG_PARTITIONED se particiona por rangos de rating_date
+    (las particiones las crea la carga, ver storage.partitions); la PK debe incluir
+    la clave de partición, y como rating_date sale de rating_ts la unicidad es la misma.
+    """
+    if settings.PG_PARTITIONED:
+        return """
+    CREATE TABLE IF NOT EXISTS fact_rating (
+        user_id INTEGER,
+        movie_id INTEGER,
+        rating REAL,
+        rating_ts BIGINT,
+        rating_date DATE NOT NULL,
+        PRIMARY KEY (user_id, movie_id, rating_ts, rating_date)
+    ) PARTITION BY RANGE (rating_date);
+    """
+    return """
+    CREATE TABLE IF NOT EXISTS fact_rating (
+        user_id INTEGER,
+        movie_id INTEGER,
+        rating REAL,
+        rating_ts BIGINT,
+        rating_date DATE,
+        PRIMARY KEY (user_id, movie_id, rating_ts)
+    );
+    """
 
 
 def init_schema() -> None:
@@ -17,19 +136,39 @@ def init_schema() -> None:
         title TEXT,
         genres TEXT
     );
+    CREATE TABLE IF NOT EXISTS dim_genre (
+        genre_id SMALLSERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS bridge_movie_genre (
+        movie_id INTEGER NOT NULL,
+        genre_id SMALLINT NOT NULL,
+        PRIMARY KEY (movie_id, genre_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_bridge_genre ON bridge_movie_genre(genre_id, movie_id);
     CREATE TABLE IF NOT EXISTS dim_user (
         user_id INTEGER PRIMARY KEY
     );
-    CREATE TABLE IF NOT EXISTS fact_rating (
-        user_id INTEGER,
-        movie_id INTEGER,
-        rating REAL,
-        rating_ts BIGINT,
-        rating_date DATE,
-        PRIMARY KEY (user_id, movie_id, rating_ts)
+    CREATE TABLE IF NOT EXISTS etl_state (
+        source TEXT PRIMARY KEY,
+        watermark BIGINT NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS etl_stage_runs (
+        stage TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        seconds DOUBLE PRECISION,
+        finished_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE TABLE IF NOT EXISTS movie_similarity (
+        movie_id INTEGER NOT NULL,
+        rank SMALLINT NOT NULL,
+        neighbor_id INTEGER NOT NULL,
+        similarity REAL NOT NULL,
+        PRIMARY KEY (movie_id, rank)
     );
     """
     with engine.begin() as conn:
-        for stmt in ddl.strip().split(";"):
+        for stmt in (fact_rating_ddl() + ddl).strip().split(";"):
             if stmt.strip():
                 conn.execute(text(stmt))
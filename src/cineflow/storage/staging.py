@@ -0,0 +1,120 @@
+"""Ficheros de staging (Parquet tipado o CSV) compartidos por convert, DQ e ingesta."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from cineflow.utils.config import settings
+
+FORMATS = ("parquet", "csv")
+
+SCHEMAS: dict[str, pa.Schema] = {
+    "ratings": pa.schema(
+        [
+            ("userId", pa.int32()),
+            ("movieId", pa.int32()),
+            ("rating", pa.float32()),
+            ("timestamp", pa.int64()),
+        ]
+    ),
+    "movies": pa.schema(
+        [
+            ("movieId", pa.int32()),
+            ("title", pa.string()),
+            ("genres", pa.string()),
+        ]
+    ),
+}
+
+
+def data_dir() -> Path:
+    return Path(settings.DATA_DIR)
+
+
+def resolve(name: str, base: Path | None = None) -> Path:
+    """
+    Devuelve el fichero de staging de `name` ('ratings' | 'movies'). Si existen
+    Parquet y CSV se usa el más reciente, para no leer un staging obsoleto.
+    """
+    base = base or data_dir()
+    candidates = [base / f"{name}.{fmt}" for fmt in FORMATS]
+    existing = [p for p in candidates if p.exists()]
+    if not existing:
+        raise FileNotFoundError(f"No existe {name}.parquet ni {name}.csv en {base}/")
+    return max(existing, key=lambda p: p.stat().st_mtime_ns)
+
+
+def iter_batches(
+    name: str, chunk_size: int, columns: Sequence[str] | None = None, base: Path | None = None
+) -> Iterator[pd.DataFrame]:
+    """Recorre el staging de `name` en lotes de `chunk_size` filas con memoria acotada."""
+    path = resolve(name, base)
+    cols = list(columns) if columns is not None else None
+    if path.suffix == ".parquet":
+        pf = pq.ParquetFile(path, memory_map=True)
+        for batch in pf.iter_batches(batch_size=chunk_size, columns=cols):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=cols, chunksize=chunk_size)
+
+
+def _target(name: str, base: Path | None, fmt: str | None) -> tuple[Path, str]:
+    fmt = fmt or settings.STAGING_FORMAT
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato de staging inválido: {fmt} (usa {', '.join(FORMATS)})")
+    path = (base or data_dir()) / f"{name}.{fmt}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path, fmt
+
+
+def write_table(
+    df: pd.DataFrame, name: str, base: Path | None = None, fmt: str | None = None
+) -> Path:
+    """Escribe `df` como staging de `name` en el formato `fmt` (por defecto el configurado)."""
+    path, fmt = _target(name, base, fmt)
+    if fmt == "parquet":
+        table = pa.Table.from_pandas(df, schema=SCHEMAS.get(name), preserve_index=False)
+        pq.write_table(table, path, compression="zstd")
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+def write_batches(
+    batches: Iterable[pa.RecordBatch],
+    name: str,
+    base: Path | None = None,
+    fmt: str | None = None,
+) -> tuple[Path, int]:
+    """
+    Escribe en streaming los lotes Arrow de `batches` como staging de `name`, con el
+    esquema tipado de SCHEMAS. Solo hay un lote en memoria a la vez. Devuelve
+    (ruta, filas escritas).
+    """
+    path, fmt = _target(name, base, fmt)
+    schema = SCHEMAS[name]
+    tmp = path.with_name(path.name + ".tmp")
+    rows = 0
+    writer: pq.ParquetWriter | pacsv.CSVWriter
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+    else:
+        writer = pacsv.CSVWriter(tmp, schema)
+    try:
+        for batch in batches:
+            writer.write_batch(batch.select(schema.names).cast(schema))
+            rows += batch.num_rows
+    except BaseException:
+        writer.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    writer.close()
+    # Renombrado atómico: un staging a medias nunca se confunde con uno completo
+    tmp.replace(path)
+    return path, rows
@@ -1,14 +1,41 @@
-"""Conversión MovieLens 100K: u.data/u.item -> ratings.csv/movies.csv."""
+"""Conversión MovieLens 100K: u.data/u.item -> staging ratings/movies (Parquet o CSV)."""
 
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
 from typing import List, cast
 
+import numpy as np
 import pandas as pd
 
+from cineflow.storage.staging import FORMATS, write_table
+
 BASE = Path("data/samples")
 
+# Géneros estándar del ML-100K (19 flags de u.item), si no hay u.genre
+ML100K_GENRES = (
+    "unknown",
+    "Action",
+    "Adventure",
+    "Animation",
+    "Children's",
+    "Comedy",
+    "Crime",
+    "Documentary",
+    "Drama",
+    "Fantasy",
+    "Film-Noir",
+    "Horror",
+    "Musical",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Thriller",
+    "War",
+    "Western",
+)
+
 
 def read_genres_list(base: Path) -> List[str]:
     """Lee u.genre si existe; si no, devuelve el fallback estándar del ML-100K."""
@@ -20,28 +47,27 @@ def read_genres_list(base: Path) -> List[str]:
         ]
         # Evita listas vacías por líneas en blanco al final
         return [g for g in genres if g]
-    # Fallback estándar (19 flags)
-    return [
-        "unknown",
-        "Action",
-        "Adventure",
-        "Animation",
-        "Children's",
-        "Comedy",
-        "Crime",
-        "Documentary",
-        "Drama",
-        "Fantasy",
-        "Film-Noir",
-        "Horror",
-        "Musical",
-        "Mystery",
-        "Romance",
-        "Sci-Fi",
-        "Thriller",
-        "War",
-        "Western",
-    ]
+    return list(ML100K_GENRES)
+
+
+def flags_to_genres(flags: np.ndarray, genres_list: List[str]) -> np.ndarray:
+    """
+    Decodifica la matriz de flags (n_películas x n_géneros) a strings 'A|B|C' de forma
+    vectorizada: cada fila se reduce a una máscara de bits con un producto matricial
+    y solo se construye el string de cada combinación distinta (unas pocas cientos).
+    """
+    bits = np.left_shift(np.int64(1), np.arange(len(genres_list), dtype=np.int64))
+    codes = (np.asarray(flags) == 1).astype(np.int64) @ bits
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    labels = np.array(
+        [
+            "|".join(g for i, g in enumerate(genres_list) if (code >> i) & 1)
+            or "(no genres listed)"
+            for code in uniq.tolist()
+        ],
+        dtype=object,
+    )
+    return cast(np.ndarray, labels[inverse])
 
 
 def convert_ratings(base: Path) -> pd.DataFrame:
@@ -78,33 +104,28 @@ def convert_movies(base: Path) -> pd.DataFrame:
             f"u.item tiene {ncols} columnas, pero se esperaban al menos {min_expected}."
         )
 
-    core = raw.iloc[:, [0, 1] + list(range(ncols - g, ncols))].copy()
-    core.columns = ["movieId", "title"] + genres_list
-
-    def flags_to_genres(row: pd.Series) -> str:
-        present = [name for name in genres_list if row[name] == 1]
-        return "|".join(present) if present else "(no genres listed)"
-
-    core["genres"] = core.apply(flags_to_genres, axis=1)
-    movies = core[["movieId", "title", "genres"]].copy()
+    movies = raw.iloc[:, [0, 1]].copy()
+    movies.columns = ["movieId", "title"]
+    movies["genres"] = flags_to_genres(raw.iloc[:, ncols - g :].to_numpy(), genres_list)
     return cast(pd.DataFrame, movies)
 
 
-def write_csv(df: pd.DataFrame, path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(path, index=False)
-
-
-def main() -> None:
-    ratings_out = BASE / "ratings.csv"
-    movies_out = BASE / "movies.csv"
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Convierte MovieLens 100K al staging")
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default=None,
+        help="Formato de salida (por defecto settings.STAGING_FORMAT)",
+    )
+    args = parser.parse_args(argv)
 
     ratings = convert_ratings(BASE)
-    write_csv(ratings, ratings_out)
+    ratings_out = write_table(ratings, "ratings", BASE, args.format)
     print(f"[OK] Escribí {ratings_out} con {len(ratings)} filas")
 
     movies = convert_movies(BASE)
-    write_csv(movies, movies_out)
+    movies_out = write_table(movies, "movies", BASE, args.format)
     print(f"[OK] Escribí {movies_out} con {len(movies)} filas")
 
 
@@ -0,0 +1,125 @@
+"""Conversión streaming de cualquier release MovieLens (100K, 1M, 10M, 20M, 25M) al staging.
+
+Layouts soportados:
+  - 100k: u.data (TSV) + u.item (flags de género)
+  - dat:  ratings.dat / movies.dat separados por '::' (ML-1M, ML-10M)
+  - csv:  ratings.csv / movies.csv con cabecera (ML-20M, ML-25M, latest)
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Iterator, List, cast
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from cineflow.storage.staging import FORMATS, SCHEMAS, write_batches, write_table
+from cineflow.tools.convert_ml100k import convert_movies
+from cineflow.utils.config import settings
+
+LAYOUTS = ("100k", "dat", "csv")
+RATING_COLUMNS = ["userId", "movieId", "rating", "timestamp"]
+BLOCK_SIZE = 64 << 20  # bytes por bloque del lector CSV de Arrow
+
+
+def detect_layout(src: Path) -> str:
+    """Deduce el layout del release a partir de los ficheros presentes en `src`."""
+    if (src / "u.data").exists():
+        return "100k"
+    if (src / "ratings.dat").exists():
+        return "dat"
+    if (src / "ratings.csv").exists():
+        return "csv"
+    raise FileNotFoundError(f"No encuentro u.data, ratings.dat ni ratings.csv en {src}/")
+
+
+def stream_ratings(
+    src: Path, layout: str, block_size: int = BLOCK_SIZE
+) -> Iterator[pa.RecordBatch]:
+    """
+    Lee los ratings del release por bloques de `block_size` bytes con el lector CSV
+    de Arrow (parseo en C++, sin objetos Python por fila) y emite lotes tipados.
+
+    El separador '::' de los .dat se lee como ':' simple: las columnas vacías que
+    quedan entre medias se descartan (los campos de ratings son solo numéricos).
+    """
+    types = {c: SCHEMAS["ratings"].field(c).type for c in RATING_COLUMNS}
+    read = pacsv.ReadOptions(block_size=block_size)
+    if layout == "100k":
+        path = src / "u.data"
+        read.column_names = RATING_COLUMNS
+        parse = pacsv.ParseOptions(delimiter="\t")
+    elif layout == "dat":
+        path = src / "ratings.dat"
+        read.column_names = ["userId", "_1", "movieId", "_2", "rating", "_3", "timestamp"]
+        parse = pacsv.ParseOptions(delimiter=":")
+    elif layout == "csv":
+        path = src / "ratings.csv"
+        parse = pacsv.ParseOptions(delimiter=",")
+    else:
+        raise ValueError(f"Layout desconocido: {layout} (usa {', '.join(LAYOUTS)})")
+
+    convert = pacsv.ConvertOptions(column_types=types, include_columns=RATING_COLUMNS)
+    with pacsv.open_csv(
+        path, read_options=read, parse_options=parse, convert_options=convert
+    ) as reader:
+        for batch in reader:
+            yield batch
+
+
+def _read_movies_dat(path: Path) -> pd.DataFrame:
+    """movies.dat (MovieID::Title::Genres): utf-8 en ML-10M, latin-1 en ML-1M."""
+    raw = path.read_bytes()
+    try:
+        content = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        content = raw.decode("latin-1")
+    rows = [line.split("::", 2) for line in content.splitlines() if line.strip()]
+    movies = pd.DataFrame(rows, columns=["movieId", "title", "genres"])
+    movies["movieId"] = movies["movieId"].astype("int32")
+    return movies
+
+
+def convert_movies_any(src: Path, layout: str) -> pd.DataFrame:
+    """Tabla de películas (movieId, title, genres con '|') para cualquier layout."""
+    if layout == "100k":
+        return convert_movies(src)
+    if layout == "dat":
+        return _read_movies_dat(src / "movies.dat")
+    movies = pd.read_csv(src / "movies.csv", usecols=["movieId", "title", "genres"])
+    return cast(pd.DataFrame, movies)
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Convierte un release MovieLens al staging")
+    parser.add_argument("--src", type=Path, required=True, help="Directorio del release")
+    parser.add_argument("--out", type=Path, default=None, help="Destino (settings.DATA_DIR)")
+    parser.add_argument("--layout", choices=LAYOUTS, default=None, help="Por defecto: auto")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="parquet | csv")
+    parser.add_argument(
+        "--block-mb", type=int, default=BLOCK_SIZE >> 20, help="MB por bloque de lectura"
+    )
+    args = parser.parse_args(argv)
+
+    out = args.out or Path(settings.DATA_DIR)
+    layout = args.layout or detect_layout(args.src)
+
+    t0 = time.perf_counter()
+    ratings_out, n = write_batches(
+        stream_ratings(args.src, layout, args.block_mb << 20), "ratings", out, args.format
+    )
+    dt = time.perf_counter() - t0
+    rate = n / dt if dt > 0 else 0.0
+    print(f"[OK] Escribí {ratings_out} con {n} filas en {dt:.2f}s ({rate:,.0f} filas/s)")
+
+    movies = convert_movies_any(args.src, layout)
+    movies_out = write_table(movies, "movies", out, args.format)
+    print(f"[OK] Escribí {movies_out} con {len(movies)} filas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Generador determinista de datos sintéticos con forma de MovieLens, a cualquier escala.
+
+Reproduce lo que importa para medir el pipeline: popularidad de películas tipo Zipf
+(unas pocas acumulan la mayoría de ratings), actividad de usuarios log-normal,
+ratings en medias estrellas con sesgo por película y timestamps crecientes. Misma
+escala y semilla -> mismos ficheros, byte a byte.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from cineflow.storage.staging import FORMATS, write_batches, write_table
+from cineflow.tools.convert_ml100k import ML100K_GENRES, flags_to_genres
+
+CHUNK_ROWS = 1_000_000  # filas por lote generado (fijo: forma parte del determinismo)
+START_TS = 789_652_009  # 1995-01-09, primer rating de MovieLens
+SPAN_S = 25 * 365 * 86_400  # los timestamps cubren ~25 años
+RATINGS = np.arange(1, 11, dtype=np.float32) / 2  # 0.5 ... 5.0
+# Frecuencia de cada media estrella en ML-25M
+RATING_P = np.array([0.016, 0.033, 0.020, 0.070, 0.048, 0.200, 0.130, 0.270, 0.080, 0.133])
+ZIPF_S = 1.0  # exponente de popularidad de películas
+USER_SIGMA = 1.2  # dispersión (log-normal) de la actividad de usuarios
+MANIFEST = "synth.json"
+
+_SUFFIXES = {"": 1, "K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+
+
+def parse_scale(scale: str | int) -> int:
+    """'100K', '2.5M', '1B' o un entero -> número de ratings."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMB]?)\s*", str(scale).upper())
+    if not m:
+        raise ValueError(f"Escala inválida: {scale} (ej. 100K, 1M, 2.5M, 1B)")
+    n = int(float(m.group(1)) * _SUFFIXES[m.group(2)])
+    if n < 1:
+        raise ValueError(f"Escala inválida: {scale}")
+    return n
+
+
+@dataclass(frozen=True)
+class Dims:
+    ratings: int
+    users: int
+    movies: int
+    seed: int
+
+    @classmethod
+    def for_scale(cls, ratings: int, seed: int = 0) -> Dims:
+        # Proporciones de los releases MovieLens: ~100 ratings por usuario y un catálogo
+        # que crece más despacio que los ratings (100K -> ~1.7K películas)
+        users = max(50, ratings // 100)
+        movies = max(100, round(17 * ratings**0.4))
+        return cls(ratings, users, movies, seed)
+
+
+def _cdf(weights: np.ndarray) -> np.ndarray:
+    cdf = np.cumsum(weights, dtype=np.float64)
+    return cdf / cdf[-1]
+
+
+def _population(dims: Dims) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CDF de popularidad de películas, CDF de actividad de usuarios y sesgo por película."""
+    rng = np.random.default_rng([dims.seed, 0])
+    # El rango de popularidad se baraja para que no dependa del movieId
+    ranks = rng.permutation(dims.movies) + 1
+    movie_cdf = _cdf(1.0 / ranks.astype(np.float64) ** ZIPF_S)
+    user_cdf = _cdf(rng.lognormal(0.0, USER_SIGMA, dims.users))
+    bias = np.round(rng.normal(0.0, 0.4, dims.movies) * 2).astype(np.float32) / 2
+    return movie_cdf, user_cdf, bias
+
+
+def iter_ratings(dims: Dims) -> Iterator[pa.RecordBatch]:
+    """
+    Lotes de CHUNK_ROWS ratings. Cada lote usa su propio generador (semilla, lote),
+    así que la memoria es la de un lote y el resultado no depende de cuántos se lean.
+    Los timestamps crecen con la fila (paso entero >= 1), lo que garantiza claves
+    (userId, movieId, timestamp) únicas.
+    """
+    movie_cdf, user_cdf, bias = _population(dims)
+    step = max(1, SPAN_S // dims.ratings)
+    rating_cdf = _cdf(RATING_P)
+    for k, lo in enumerate(range(0, dims.ratings, CHUNK_ROWS)):
+        n = min(CHUNK_ROWS, dims.ratings - lo)
+        rng = np.random.default_rng([dims.seed, 1, k])
+        movie_idx = np.searchsorted(movie_cdf, rng.random(n), side="right")
+        user_idx = np.searchsorted(user_cdf, rng.random(n), side="right")
+        stars = RATINGS[np.searchsorted(rating_cdf, rng.random(n), side="right")]
+        rating = np.clip(stars + bias[movie_idx], 0.5, 5.0)
+        ts = START_TS + (np.arange(lo, lo + n, dtype=np.int64) * step) + rng.integers(0, step, n)
+        yield pa.RecordBatch.from_arrays(
+            [
+                pa.array(user_idx.astype(np.int32) + 1),
+                pa.array(movie_idx.astype(np.int32) + 1),
+                pa.array(rating.astype(np.float32)),
+                pa.array(ts),
+            ],
+            names=["userId", "movieId", "rating", "timestamp"],
+        )
+
+
+def movies_frame(dims: Dims) -> pd.DataFrame:
+    """Catálogo con títulos 'Synthetic Movie N (año)' y uno o más géneros de MovieLens."""
+    rng = np.random.default_rng([dims.seed, 2])
+    genres = list(ML100K_GENRES[1:])  # sin 'unknown'
+    # Géneros frecuentes (Drama, Comedy...) con más peso, como en MovieLens
+    weight = np.array([0.12 if g in ("Drama", "Comedy") else 0.04 for g in genres])
+    flags = rng.random((dims.movies, len(genres))) < weight
+    flags[np.arange(dims.movies), rng.integers(0, len(genres), dims.movies)] = True
+    years = 2020 - np.minimum(rng.exponential(20.0, dims.movies).astype(int), 100)
+    ids = np.arange(1, dims.movies + 1, dtype=np.int32)
+    return pd.DataFrame(
+        {
+            "movieId": ids,
+            "title": [f"Synthetic Movie {i} ({y})" for i, y in zip(ids, years)],
+            "genres": flags_to_genres(flags.astype(int), genres),
+        }
+    )
+
+
+def is_current(out: Path, dims: Dims, fmt: str) -> bool:
+    """True si `out` ya tiene el staging de estas dimensiones y formato."""
+    path = out / MANIFEST
+    if not path.exists():
+        return False
+    manifest = json.loads(path.read_text())
+    return bool(manifest == {**asdict(dims), "format": fmt})
+
+
+def generate(dims: Dims, out: Path, fmt: str = "parquet") -> tuple[Path, Path]:
+    """Escribe ratings y movies en `out` (en streaming) y el manifiesto de la generación."""
+    (out / MANIFEST).unlink(missing_ok=True)
+    ratings, _ = write_batches(iter_ratings(dims), "ratings", out, fmt)
+    movies = write_table(movies_frame(dims), "movies", out, fmt)
+    (out / MANIFEST).write_text(json.dumps({**asdict(dims), "format": fmt}, indent=2) + "\n")
+    return ratings, movies
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Genera un staging MovieLens sintético")
+    parser.add_argument("--scale", default="1M", help="Ratings a generar: 100K, 1M, 10M...")
+    parser.add_argument("--out", type=Path, default=Path("data/bench"), help="Destino")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    args = parser.parse_args(argv)
+
+    dims = Dims.for_scale(parse_scale(args.scale), args.seed)
+    t0 = time.perf_counter()
+    ratings, movies = generate(dims, args.out, args.format)
+    dt = time.perf_counter() - t0
+    rate = dims.ratings / dt if dt > 0 else 0.0
+    print(
+        f"[OK] {ratings} ({dims.ratings} ratings, {dims.users} usuarios) y {movies}"
+        f" ({dims.movies} películas) en {dt:.2f}s ({rate:,.0f} filas/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Métricas por etapa del pipeline: filas, filas/s, pico de RSS y viajes/bytes a
+Postgres y Mongo, capturados con listeners de SQLAlchemy y PyMongo.
+
+El pico de RSS es del proceso: solo es de la etapa si se mide con `isolated_rss`
+(etapas en serie, que reinician el pico al empezar); si no, incluye lo que usaran
+antes o a la vez otras etapas y se marca con scope="process".
+
+La etapa activa vive en un ContextVar: los listeners solo cuentan lo que ocurre
+dentro de `measure(...)` en ese hilo (o en hilos lanzados con `propagate`). Los
+procesos hijos (carga con workers > 1) no suman viajes ni bytes.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterator, Sequence, TypeVar
+
+import bson
+from pymongo import monitoring
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+T = TypeVar("T")
+
+DBS = ("postgres", "mongo")
+RECEIVED_DBS = ("mongo",)  # Postgres: el cursor DBAPI no expone los bytes recibidos
+
+
+@dataclass
+class StageMetrics:
+    """Métricas de una ejecución de etapa. `bytes_sent`: SQL y COPY enviados a Postgres,
+    comandos BSON a Mongo; `bytes_received`: respuestas BSON de Mongo."""
+
+    stage: str
+    status: str = "ok"
+    seconds: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    peak_rss_bytes: int = 0
+    rss_scope: str = "process"  # "stage" si se reinició el pico al empezar (en serie)
+    roundtrips: dict[str, int] = field(default_factory=lambda: dict.fromkeys(DBS, 0))
+    bytes_sent: dict[str, int] = field(default_factory=lambda: dict.fromkeys(DBS, 0))
+    bytes_received: dict[str, int] = field(default_factory=lambda: dict.fromkeys(RECEIVED_DBS, 0))
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows_in / self.seconds if self.seconds > 0 else 0.0
+
+    def add_rows(self, rows_in: int = 0, rows_out: int = 0) -> None:
+        with self._lock:
+            self.rows_in += rows_in
+            self.rows_out += rows_out
+
+    def add_db(self, db: str, sent: int = 0, received: int = 0, roundtrips: int = 1) -> None:
+        with self._lock:
+            self.roundtrips[db] += roundtrips
+            self.bytes_sent[db] += sent
+            if received:
+                self.bytes_received[db] += received
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "stage": self.stage,
+            "status": self.status,
+            "seconds": round(self.seconds, 4),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_per_s": round(self.rows_per_s, 1),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "rss_scope": self.rss_scope,
+            **{f"{db}_roundtrips": n for db, n in self.roundtrips.items()},
+            **{f"{db}_bytes_sent": n for db, n in self.bytes_sent.items()},
+            **{f"{db}_bytes_received": n for db, n in self.bytes_received.items()},
+        }
+
+    def summary(self) -> str:
+        parts = []
+        for name in DBS:
+            part = f"{name}: {self.roundtrips[name]} viajes, {self.bytes_sent[name] / 1e6:.2f} MB"
+            if name in self.bytes_received:
+                part += f" enviados / {self.bytes_received[name] / 1e6:.2f} MB recibidos"
+            else:
+                part += " enviados"
+            parts.append(part)
+        rss = "rss" if self.rss_scope == "stage" else "rss proceso"
+        return (
+            f"{self.rows_in} filas in / {self.rows_out} out ({self.rows_per_s:,.0f} filas/s)"
+            f" | {rss} {self.peak_rss_bytes >> 20} MB | {' | '.join(parts)}"
+        )
+
+
+_current: contextvars.ContextVar[StageMetrics | None] = contextvars.ContextVar(
+    "cineflow_stage_metrics", default=None
+)
+_trace_sql = False
+_installed = False
+_install_lock = threading.Lock()
+
+
+def current() -> StageMetrics | None:
+    return _current.get()
+
+
+def add_rows(rows_in: int = 0, rows_out: int = 0) -> None:
+    """Suma filas a la etapa activa (no hace nada fuera de `measure`)."""
+    m = _current.get()
+    if m is not None:
+        m.add_rows(rows_in, rows_out)
+
+
+def add_db(db: str, sent: int = 0, received: int = 0, roundtrips: int = 1) -> None:
+    """Para tráfico que no pasa por los listeners (p. ej. COPY con el cursor DBAPI)."""
+    m = _current.get()
+    if m is not None:
+        m.add_db(db, sent, received, roundtrips)
+
+
+_PROC_STATUS = Path("/proc/self/status")
+
+
+def peak_rss_bytes() -> int:
+    """
+    Pico de RSS del proceso (desde el último reset_peak_rss, en Linux) y de sus hijos
+    ya terminados; 0 si no se puede medir.
+    """
+    if resource is None:
+        return 0
+    kib = 1 if sys.platform == "darwin" else 1024  # ru_maxrss: bytes en macOS, KiB en Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * kib
+    if _PROC_STATUS.exists():
+        for line in _PROC_STATUS.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                own = int(line.split()[1]) * 1024
+                break
+    return int(max(own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * kib))
+
+
+def reset_peak_rss() -> bool:
+    """Reinicia el pico de RSS del proceso (Linux); para medir etapas que van en serie."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        return False
+    return True
+
+
+@contextmanager
+def measure(stage: str, isolated_rss: bool = False) -> Iterator[StageMetrics]:
+    """
+    Activa las métricas de `stage` en este contexto; al salir fija duración, RSS y
+    estado. Con `isolated_rss` (solo si no corre otra etapa a la vez) se reinicia el
+    pico de RSS al empezar y el valor es de la etapa; si no, es el pico del proceso.
+    """
+    m = StageMetrics(stage)
+    if isolated_rss and reset_peak_rss():
+        m.rss_scope = "stage"
+    token = _current.set(m)
+    t0 = time.perf_counter()
+    try:
+        yield m
+    except BaseException:
+        m.status = "failed"
+        raise
+    finally:
+        m.seconds = time.perf_counter() - t0
+        m.peak_rss_bytes = peak_rss_bytes()
+        _current.reset(token)
+
+
+def propagate(fn: Callable[..., T]) -> Callable[..., T]:
+    """Envuelve `fn` para ejecutarla en otro hilo con la etapa activa del que la envía."""
+    ctx = contextvars.copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> T:
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+# --- listeners ---------------------------------------------------------------------
+
+
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    m = _current.get()
+    if m is not None:
+        m.add_db("postgres", sent=len(statement.encode()))
+    if _trace_sql and context is not None:
+        # En el contexto de la sentencia: si falla, el inicio se descarta con ella
+        context.cineflow_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    t0 = getattr(context, "cineflow_t0", None)
+    if not _trace_sql or t0 is None:
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    m = _current.get()
+    sql = " ".join(statement.split())
+    sql = sql if len(sql) <= 160 else sql[:157] + "..."
+    print(f"  [sql {m.stage if m else '-'}] {ms:8.1f} ms  rows={cursor.rowcount:<7} {sql}")
+
+
+class _MongoListener(monitoring.CommandListener):
+    # Los eventos llegan en el hilo que ejecuta el comando, así que ven su ContextVar
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        m = _current.get()
+        if m is not None:
+            m.add_db("mongo", sent=len(bson.encode(event.command)))
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        m = _current.get()
+        if m is not None:
+            m.add_db("mongo", received=len(bson.encode(event.reply)), roundtrips=0)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+
+def install(trace_sql: bool = False) -> None:
+    """
+    Registra los listeners (una vez por proceso). El de PyMongo solo afecta a los
+    clientes creados después, así que se llama antes de abrir conexiones a Mongo.
+    """
+    global _installed, _trace_sql
+    _trace_sql = trace_sql
+    with _install_lock:
+        if _installed:
+            return
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        monitoring.register(_MongoListener())
+        _installed = True
+
+
+# --- salida ------------------------------------------------------------------------
+
+_PROM = (
+    ("seconds", "Duración de la etapa en segundos"),
+    ("rows_in", "Filas leídas por la etapa"),
+    ("rows_out", "Filas escritas por la etapa"),
+    ("rows_per_s", "Filas leídas por segundo"),
+)
+
+
+def prometheus_text(stages: Sequence[StageMetrics], finished_at: float) -> str:
+    """Formato textfile de Prometheus (node_exporter) con una serie por etapa."""
+    lines: list[str] = []
+    rows = [(m, m.to_dict()) for m in stages]
+    for key, help_text in _PROM:
+        name = f"cineflow_stage_{key}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f'{name}{{stage="{m.stage}"}} {d[key]}' for m, d in rows]
+    name = "cineflow_stage_peak_rss_bytes"
+    help_text = (
+        "Pico de RSS al terminar la etapa: de la etapa (scope=stage, etapas en serie)"
+        " o del proceso hasta ese momento (scope=process)"
+    )
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [
+        f'{name}{{stage="{m.stage}",scope="{m.rss_scope}"}} {m.peak_rss_bytes}' for m in stages
+    ]
+    for key, help_text in (
+        ("roundtrips", "Viajes a la base de datos"),
+        ("bytes_sent", "Bytes enviados a la base de datos"),
+        ("bytes_received", "Bytes recibidos de la base de datos (solo Mongo)"),
+    ):
+        name = f"cineflow_stage_db_{key}"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [
+            f'{name}{{stage="{m.stage}",db="{db}"}} {n}'
+            for m in stages
+            for db, n in getattr(m, key).items()
+        ]
+    name = "cineflow_stage_success"
+    lines += [f"# HELP {name} 1 si la etapa terminó bien", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{stage="{m.stage}"}} {int(m.status == "ok")}' for m in stages]
+    name = "cineflow_run_finished_timestamp_seconds"
+    lines += [f"# HELP {name} Fin de la última ejecución", f"# TYPE {name} gauge"]
+    lines.append(f"{name} {finished_at:.0f}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path: str | Path, stages: Sequence[StageMetrics]) -> None:
+    """
+    `.prom`: reescribe el fichero de forma atómica (textfile collector de Prometheus).
+    Cualquier otra extensión: añade una línea JSON por etapa con el id de la ejecución.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    if path.suffix == ".prom":
+        tmp = path.with_name(f".{path.name}.{os.getpid()}")
+        tmp.write_text(prometheus_text(stages, now), encoding="utf-8")
+        os.replace(tmp, path)
+        return
+    run_id = uuid.uuid4().hex[:12]
+    ts = datetime.fromtimestamp(now, timezone.utc).isoformat(timespec="seconds")
+    with path.open("a", encoding="utf-8") as f:
+        for m in stages:
+            f.write(json.dumps({"run_id": run_id, "ts": ts, **m.to_dict()}) + "\n")
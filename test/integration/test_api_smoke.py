@@ -1,5 +1,7 @@
+import pytest
 from fastapi.testclient import TestClient
 
+from cineflow.api import main as api_main
 from cineflow.api.main import app
 
 client = TestClient(app)
@@ -14,3 +16,12 @@ def test_movies_top_inmemory() -> None:
     r = client.get("/movies/top?limit=5")
     assert r.status_code == 200
 
+
+
+def test_metrics_daily_pages_only_on_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(api_main, "DAILY_PAGE_SIZE", 1)
+    full = client.get("/metrics/daily").json()["items"]
+    page = client.get("/metrics/daily?limit=2").json()["items"]
+    assert len(full) > 2 and page == full[:2]
+    after = page[-1]["rating_date"]
+    assert client.get(f"/metrics/daily?after={after}").json()["items"] == full[2:3]
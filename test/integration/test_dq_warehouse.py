@@ -0,0 +1,9 @@
+from cineflow.dq.warehouse import run_checks
+
+
+def test_warehouse_checks_pass() -> None:
+    # Requiere el warehouse cargado (python -m cineflow.runner --skip-validate)
+    report = run_checks("all")
+    print(report.summary())
+    assert report.ok
+    assert [r.rule for r in report.results][-1] == "raw_drift"
@@ -0,0 +1,36 @@
+import asyncio
+
+import asyncpg
+
+from cineflow.api.cache import WarehouseGeneration
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_client import database_url
+
+
+async def _kill_and_notify() -> tuple[bool, int, int]:
+    generation = WarehouseGeneration(backoff_s=0.05, max_backoff_s=0.2)
+    await generation.start()
+    admin = await asyncpg.connect(database_url(None))
+    try:
+        old_conn = generation._conn
+        assert old_conn is not None
+        await admin.execute("SELECT pg_terminate_backend($1)", old_conn.get_server_pid())
+        for _ in range(100):  # hasta 5 s para detectar la caída y reconectar
+            await asyncio.sleep(0.05)
+            if generation.listening and generation._conn is not old_conn:
+                break
+        reconnected = generation.listening and generation._conn is not old_conn
+        # Un NOTIFY posterior a la reconexión llega al valor en memoria
+        target = generation.value + 1000
+        await admin.execute("SELECT pg_notify($1, $2)", etl_state.GENERATION_CHANNEL, str(target))
+        await asyncio.sleep(0.2)
+        return reconnected, generation.value, target
+    finally:
+        await generation.stop()
+        await admin.close()
+
+
+def test_listener_reconnects_after_connection_loss() -> None:
+    reconnected, value, target = asyncio.run(_kill_and_notify())
+    assert reconnected
+    assert value == target
@@ -0,0 +1,77 @@
+from typing import Iterator
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from cineflow.pipelines.load_warehouse import (
+    FACT_COLUMNS,
+    apply_pending_stats,
+    create_staging,
+    merge_staged_ratings,
+)
+from cineflow.storage.postgres_admin import (
+    ensure_daily_metrics,
+    ensure_movie_daily_stats,
+    ensure_movie_stats,
+)
+from cineflow.storage.postgres_client import copy_dataframe, get_engine
+
+SCHEMA = "cineflow_test_load_aggregates"
+DAY = 86400
+
+
+@pytest.fixture
+def conn() -> Iterator[Connection]:
+    """Warehouse vacío en un esquema desechable: todo se deshace al final."""
+    with get_engine().connect() as c:
+        trans = c.begin()
+        c.execute(text(f"CREATE SCHEMA {SCHEMA}; SET LOCAL search_path = {SCHEMA}"))
+        c.execute(text("CREATE TABLE fact_rating (LIKE public.fact_rating INCLUDING ALL)"))
+        ensure_movie_stats(c)
+        ensure_movie_daily_stats(c)
+        ensure_daily_metrics(c)
+        try:
+            yield c
+        finally:
+            trans.rollback()
+
+
+def _stage(conn: Connection, rows: list[tuple[int, int, float, int]]) -> int:
+    """Un tramo de worker: staging + merge a fact_rating (deltas a etl_pending_stats)."""
+    ts = pd.Series([r[3] for r in rows], dtype="int64")
+    frame = pd.DataFrame(
+        {
+            "user_id": [r[0] for r in rows],
+            "movie_id": [r[1] for r in rows],
+            "rating": [r[2] for r in rows],
+            "rating_ts": ts,
+            "rating_date": ts.astype("datetime64[s]").dt.date,
+        }
+    )
+    create_staging(conn)
+    copy_dataframe(conn, frame, "stg_rating", FACT_COLUMNS)
+    return merge_staged_ratings(conn)
+
+
+def test_pending_stats_from_several_ranges_match_fact_rating(conn: Connection) -> None:
+    # Dos tramos con las mismas películas y días; el segundo repite una fila ya cargada
+    assert _stage(conn, [(1, 10, 4.0, DAY), (2, 10, 2.0, DAY + 5), (1, 20, 3.0, 2 * DAY)]) == 3
+    assert _stage(conn, [(3, 10, 5.0, DAY + 9), (1, 20, 3.0, 2 * DAY), (3, 20, 1.0, 2 * DAY)]) == 2
+
+    assert apply_pending_stats(conn) == 5
+    assert conn.execute(text("SELECT COUNT(*) FROM etl_pending_stats")).scalar() == 0
+    stats = conn.execute(
+        text("SELECT movie_id, ratings, rating_sum, avg_rating FROM movie_stats ORDER BY 1")
+    ).all()
+    assert [tuple(map(float, s)) for s in stats] == [(10, 3, 11.0, 3.67), (20, 2, 4.0, 2.0)]
+    daily = conn.execute(
+        text("SELECT movie_id, ratings FROM movie_daily_stats ORDER BY movie_id, rating_date")
+    ).all()
+    assert [tuple(d) for d in daily] == [(10, 3), (20, 2)]
+    assert conn.execute(text("SELECT COUNT(*) FROM etl_touched_dates")).scalar() == 2
+
+    # Una segunda aplicación sin tramos nuevos no cambia nada
+    assert apply_pending_stats(conn) == 0
+    assert conn.execute(text("SELECT SUM(ratings) FROM movie_stats")).scalar() == 5
@@ -0,0 +1,115 @@
+from datetime import date
+from typing import Iterator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from cineflow.dq.warehouse import validate_warehouse
+from cineflow.storage import partitions
+from cineflow.storage.postgres_admin import (
+    ensure_daily_metrics,
+    ensure_movie_daily_stats,
+    ensure_movie_stats,
+    refresh_daily_metrics,
+)
+from cineflow.storage.postgres_client import get_engine
+
+SCHEMA = "cineflow_test_partitions"
+# (user_id, movie_id, rating, rating_date): dos años, particiones anuales
+RATINGS = [
+    (1, 10, 4.0, date(1999, 3, 1)),
+    (2, 10, 2.0, date(2000, 2, 1)),
+    (3, 10, 5.0, date(2000, 9, 1)),
+    (1, 20, 3.0, date(2000, 9, 1)),
+]
+
+
+@pytest.fixture
+def conn() -> Iterator[Connection]:
+    """fact_rating particionada en un esquema desechable: todo se deshace al final."""
+    with get_engine().connect() as c:
+        trans = c.begin()
+        c.execute(text(f"CREATE SCHEMA {SCHEMA}; SET LOCAL search_path = {SCHEMA}"))
+        c.execute(
+            text("""
+            CREATE TABLE fact_rating (
+                user_id INTEGER, movie_id INTEGER, rating REAL, rating_ts BIGINT,
+                rating_date DATE NOT NULL,
+                PRIMARY KEY (user_id, movie_id, rating_ts, rating_date)
+            ) PARTITION BY RANGE (rating_date);
+            CREATE TABLE fact_rating_p1999 PARTITION OF fact_rating
+                FOR VALUES FROM ('1999-01-01') TO ('2000-01-01');
+            CREATE TABLE fact_rating_p2000 PARTITION OF fact_rating
+                FOR VALUES FROM ('2000-01-01') TO ('2001-01-01');
+        """)
+        )
+        c.execute(
+            text("""
+            INSERT INTO fact_rating
+            VALUES (:u, :m, :r, EXTRACT(EPOCH FROM CAST(:d AS timestamp))::bigint, :d)
+        """),
+            [{"u": u, "m": m, "r": r, "d": d} for u, m, r, d in RATINGS],
+        )
+        # Dimensiones y etl_state propias para la DQ del warehouse
+        for table in ("dim_movie", "dim_user", "etl_state"):
+            c.execute(text(f"CREATE TABLE {table} (LIKE public.{table} INCLUDING ALL)"))
+        c.execute(text("INSERT INTO dim_movie VALUES (10, 'A', 'Drama'), (20, 'B', 'Comedy')"))
+        c.execute(text("INSERT INTO dim_user SELECT DISTINCT user_id FROM fact_rating"))
+        ensure_movie_stats(c)
+        ensure_movie_daily_stats(c)
+        ensure_daily_metrics(c)
+        try:
+            yield c
+        finally:
+            trans.rollback()
+
+
+def _days(conn: Connection, table: str) -> list[date]:
+    return list(
+        conn.execute(text(f"SELECT DISTINCT rating_date FROM {table} ORDER BY 1")).scalars()
+    )
+
+
+def test_purge_with_cutoff_inside_a_partition_keeps_its_days(conn: Connection) -> None:
+    # 2000-06-15 cae dentro de fact_rating_p2000: solo se borra 1999
+    assert partitions.purge_before(conn, date(2000, 6, 15)) == ["fact_rating_p1999"]
+    kept = [date(2000, 2, 1), date(2000, 9, 1)]
+    assert _days(conn, "fact_rating") == kept
+    assert _days(conn, "daily_metrics") == kept
+    assert _days(conn, "movie_daily_stats") == kept
+    stats = conn.execute(text("SELECT movie_id, ratings FROM movie_stats ORDER BY 1")).all()
+    assert [tuple(r) for r in stats] == [(10, 2), (20, 1)]
+
+
+def _raw_counts(ratings_wm: int | None, movies_wm: int | None) -> tuple[int, int]:
+    return len(RATINGS), 2  # raw sigue teniendo todo lo cargado, también lo purgado
+
+
+def test_warehouse_dq_passes_after_purge_and_detach(conn: Connection) -> None:
+    assert validate_warehouse("all", conn=conn, raw_counts=_raw_counts).ok
+    partitions.purge_before(conn, date(2000, 1, 1))
+    assert validate_warehouse("all", conn=conn, raw_counts=_raw_counts).ok
+    partitions.detach_partition(conn, "fact_rating_p2000")
+    assert validate_warehouse("all", conn=conn, raw_counts=_raw_counts).ok
+
+
+def test_detach_and_attach_resync_aggregates(conn: Connection) -> None:
+    partitions.detach_partition(conn, "fact_rating_p2000")
+    assert conn.execute(text("SELECT SUM(ratings) FROM movie_stats")).scalar() == 1
+    assert _days(conn, "movie_daily_stats") == [date(1999, 3, 1)]
+    refresh_daily_metrics(conn)  # la etapa admin recalcula los días marcados
+    assert _days(conn, "daily_metrics") == [date(1999, 3, 1)]
+
+    partitions.attach_partition(conn, "fact_rating_p2000", date(2000, 1, 1), date(2001, 1, 1))
+    assert conn.execute(text("SELECT SUM(ratings) FROM movie_stats")).scalar() == 4
+    refresh_daily_metrics(conn)
+    assert (
+        _days(conn, "daily_metrics")
+        == _days(conn, "movie_daily_stats")
+        == [
+            date(1999, 3, 1),
+            date(2000, 2, 1),
+            date(2000, 9, 1),
+        ]
+    )
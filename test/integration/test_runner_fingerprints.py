@@ -0,0 +1,53 @@
+from contextlib import nullcontext
+from dataclasses import replace
+from typing import Iterator
+
+import pytest
+from sqlalchemy import text
+
+from cineflow.runner import build_stages
+from cineflow.scheduler import RAN, SKIPPED, run_dag
+from cineflow.storage import etl_state
+from cineflow.storage.postgres_client import get_engine
+
+DOWNSTREAM = ("dq_warehouse", "admin_views", "similarity")
+PREFIX = "test_fp_"  # huellas propias en etl_stage_runs: no pisan las del runner
+
+
+@pytest.fixture
+def load_rows() -> Iterator[int | None]:
+    """Restaura el contador LOAD_ROWS y borra las huellas de prueba al terminar."""
+    with get_engine().connect() as conn:
+        original = etl_state.get_watermark(conn, etl_state.LOAD_ROWS)
+    yield original
+    with get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM etl_state WHERE source = :s"), {"s": etl_state.LOAD_ROWS})
+        if original is not None:
+            etl_state.add_counter(conn, etl_state.LOAD_ROWS, original)
+        conn.execute(text("DELETE FROM etl_stage_runs WHERE stage LIKE :p"), {"p": f"{PREFIX}%"})
+
+
+def test_late_rating_reruns_downstream_stages(load_rows: int | None) -> None:
+    # Mismas huellas que el runner, sin ejecutar las etapas de verdad
+    stages = [
+        replace(s, name=PREFIX + s.name, run=lambda: None, deps=())
+        for s in build_stages()
+        if s.name in DOWNSTREAM
+    ]
+
+    def run() -> set[str]:
+        return set(run_dag(stages, lambda stage: nullcontext()).values())
+
+    run()
+    assert run() == {SKIPPED}  # sin cargas entre medias no se repiten
+
+    # Carga de un rating tardío: queda bajo LOAD_RATINGS, que no se mueve
+    with get_engine().begin() as conn:
+        wm = etl_state.get_watermark(conn, etl_state.LOAD_RATINGS)
+        if wm is None:
+            pytest.skip("requiere el warehouse cargado (python -m cineflow.runner)")
+        etl_state.set_watermark(conn, etl_state.LOAD_RATINGS, wm - 60)
+        etl_state.add_counter(conn, etl_state.LOAD_ROWS, 1)
+        assert etl_state.get_watermark(conn, etl_state.LOAD_RATINGS) == wm
+
+    assert run() == {RAN}
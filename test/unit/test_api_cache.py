@@ -0,0 +1,40 @@
+from cineflow.api.cache import ResponseCache, etag, etag_matches
+
+
+def test_cache_hit_and_generation_invalidation() -> None:
+    cache = ResponseCache(maxsize=8, ttl_s=60)
+    cache.put(("movies_top", 10), 1, b"v1")
+
+    assert cache.get(("movies_top", 10), 1) == b"v1"
+    # Tras una carga (nueva generación) la entrada deja de servirse
+    assert cache.get(("movies_top", 10), 2) is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+
+def test_cache_lru_and_ttl() -> None:
+    cache = ResponseCache(maxsize=2, ttl_s=60)
+    cache.put("a", 1, 1)
+    cache.put("b", 1, 2)
+    cache.get("a", 1)
+    cache.put("c", 1, 3)  # expulsa "b", el menos usado
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) == 1
+
+    expired = ResponseCache(maxsize=2, ttl_s=0)
+    expired.put("a", 1, 1)
+    assert expired.get("a", 1) is None
+
+
+def test_etag_depends_on_generation_params_and_accept() -> None:
+    tag = etag(4, "/movies/top", [("limit", "5"), ("genre", "Drama")], "application/json")
+    # El orden de los parámetros no cambia la versión; la generación y el Accept sí
+    assert tag == etag(4, "/movies/top", [("genre", "Drama"), ("limit", "5")], "application/json")
+    assert tag.startswith('W/"g4-')
+    assert tag != etag(5, "/movies/top", [("limit", "5"), ("genre", "Drama")], "application/json")
+    assert tag != etag(4, "/movies/top", [("limit", "5"), ("genre", "Drama")], "text/csv")
+
+    assert etag_matches(f'"x", {tag}', tag)
+    assert etag_matches(tag.removeprefix("W/"), tag)
+    assert etag_matches("*", tag)
+    assert not etag_matches(None, tag)
+    assert not etag_matches('W/"g3-0"', tag)
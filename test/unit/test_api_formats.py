@@ -0,0 +1,29 @@
+from datetime import date
+from decimal import Decimal
+
+import pyarrow as pa
+
+from cineflow.api import formats
+
+
+def test_negotiate_accept_header() -> None:
+    assert formats.negotiate(None) == formats.JSON
+    assert formats.negotiate("*/*") == formats.JSON
+    assert formats.negotiate("application/x-ndjson") == formats.NDJSON
+    assert (
+        formats.negotiate("application/json;q=0.5, application/vnd.apache.parquet;q=0.9")
+        == formats.PARQUET
+    )
+
+
+def test_ndjson_and_arrow_roundtrip() -> None:
+    rows = [{"rating_date": date(1998, 1, 1), "ratings_cnt": 3, "avg_rating": Decimal("3.5")}]
+    assert formats.ndjson_lines(rows) == (
+        b'{"rating_date":"1998-01-01","ratings_cnt":3,"avg_rating":"3.5"}\n'
+    )
+
+    schema = pa.schema([("rating_date", pa.date32()), ("ratings_cnt", pa.int32())])
+    table = formats.to_arrow(rows, schema)
+    back = pa.ipc.open_stream(formats.arrow_ipc(table)).read_all()
+    assert back.equals(table)
+    assert back.column("ratings_cnt").to_pylist() == [3]
@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, text
+
+from cineflow.api import telemetry
+
+
+def test_request_records_sql_phases_and_histograms() -> None:
+    telemetry.install()
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))  # fuera de una petición no cuenta
+        with telemetry.request("/test/sql") as timing:
+            conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            conn.execute(text("INSERT INTO t VALUES (1), (2)"))
+            with telemetry.phase("serialize"):
+                conn.execute(text("SELECT x FROM t")).all()
+
+    assert timing.phases["sql"] > 0 and timing.phases["serialize"] > 0
+    assert timing.server_timing(0.5).endswith("app;dur=500.00")
+    assert telemetry.SQL_SECONDS.count("/test/sql", "INSERT t") == 1
+    assert telemetry.SQL_SECONDS.count("/test/sql", "SELECT t") == 1
+    assert telemetry.PHASE_SECONDS.count("/test/sql", "serialize") == 1
+
+    text_out = telemetry.prometheus_text()
+    assert 'cineflow_api_sql_rows_total{endpoint="/test/sql",statement="INSERT t"} 2' in text_out
+    assert 'cineflow_api_sql_seconds_count{endpoint="/test/sql",statement="SELECT t"} 1' in text_out
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    h = telemetry.Histogram("x_seconds", "prueba", ("endpoint",))
+    for v in (0.0002, 0.003, 0.003, 20.0):
+        h.observe(v, "/a")
+    lines = h.render()
+    assert 'x_seconds_bucket{endpoint="/a",le="0.0005"} 1' in lines
+    assert 'x_seconds_bucket{endpoint="/a",le="0.005"} 3' in lines
+    assert 'x_seconds_bucket{endpoint="/a",le="10.0"} 3' in lines
+    assert 'x_seconds_bucket{endpoint="/a",le="+Inf"} 4' in lines
+    assert 'x_seconds_count{endpoint="/a"} 4' in lines
+    sql = "\n select * from movie_stats s join dim_movie m"
+    assert telemetry.statement_label(sql) == "SELECT movie_stats"
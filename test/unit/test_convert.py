@@ -0,0 +1,24 @@
+from pathlib import Path
+
+import numpy as np
+
+from cineflow.tools.convert_ml100k import flags_to_genres
+from cineflow.tools.convert_movielens import detect_layout, stream_ratings
+
+
+def test_flags_to_genres_vectorized() -> None:
+    flags = np.array([[0, 1, 1], [0, 0, 0], [1, 0, 0], [0, 1, 1]])
+    genres = flags_to_genres(flags, ["unknown", "Action", "Comedy"])
+    assert genres.tolist() == ["Action|Comedy", "(no genres listed)", "unknown", "Action|Comedy"]
+
+
+def test_stream_ratings_dat_layout(tmp_path: Path) -> None:
+    (tmp_path / "ratings.dat").write_text("1::10::3.5::978300760\n2::20::5::978302109\n")
+    assert detect_layout(tmp_path) == "dat"
+
+    batches = list(stream_ratings(tmp_path, "dat"))
+    rows = [r for b in batches for r in b.to_pylist()]
+    assert rows == [
+        {"userId": 1, "movieId": 10, "rating": 3.5, "timestamp": 978300760},
+        {"userId": 2, "movieId": 20, "rating": 5.0, "timestamp": 978302109},
+    ]
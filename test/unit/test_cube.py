@@ -0,0 +1,53 @@
+from datetime import date
+
+import pandas as pd
+
+from cineflow.analytics.cube import Cube
+
+
+def _cube() -> Cube:
+    cells = pd.DataFrame(
+        [
+            # movie_id, rating_date, ratings, rating_sum
+            (1, date(1997, 1, 1), 2, 9.0),
+            (1, date(1998, 1, 1), 1, 2.0),
+            (2, date(1997, 6, 1), 3, 12.0),
+            (3, date(1998, 2, 1), 2, 10.0),
+            (9, date(1998, 2, 1), 5, 25.0),  # sin fila en dim_movie: se ignora
+        ],
+        columns=["movie_id", "rating_date", "ratings", "rating_sum"],
+    )
+    movies = pd.DataFrame(
+        {"movie_id": [3, 1, 2], "title": ["Twin (1998)", "Alpha (1995)", "Twin (1998)"]}
+    )
+    genres = pd.DataFrame({"movie_id": [1, 2, 3, 3], "genre": ["Drama", "Comedy", "Drama", "War"]})
+    daily = pd.DataFrame(
+        {"rating_date": [date(1998, 1, 1), date(1997, 1, 1)], "ratings_cnt": [1, 2]}
+    )
+    return Cube.from_frames(cells, movies, genres, daily, generation=3)
+
+
+def test_top_movies_groups_titles_and_filters_by_date() -> None:
+    cube = _cube()
+    top = cube.top_movies(limit=10, min_votes=1)
+    # Las dos "Twin (1998)" se agregan: (12 + 10) / 5 = 4.4
+    assert top.to_dict("records") == [
+        {"title": "Twin (1998)", "ratings": 5, "avg_rating": 4.4},
+        {"title": "Alpha (1995)", "ratings": 3, "avg_rating": 3.67},
+    ]
+    since = cube.top_movies(limit=10, min_votes=1, since=date(1997, 12, 31))
+    assert since.values.tolist() == [["Twin (1998)", 2, 5.0], ["Alpha (1995)", 1, 2.0]]
+    assert cube.top_movies(limit=10, min_votes=4).title.tolist() == ["Twin (1998)"]
+    assert cube.top_movies(limit=10, min_votes=1, since=date(2000, 1, 1)).empty
+
+
+def test_top_genres_and_daily() -> None:
+    cube = _cube()
+    genres = cube.top_genres(limit=2, min_votes=1)
+    assert genres.to_dict("records") == [
+        {"genre": "War", "total_ratings": 2, "avg_rating": 5.0},
+        {"genre": "Drama", "total_ratings": 5, "avg_rating": 4.2},
+    ]
+    assert cube.daily().rating_date.tolist() == [date(1997, 1, 1), date(1998, 1, 1)]
+    assert cube.daily(date(1997, 6, 1)).ratings_cnt.tolist() == [1]
+    assert cube.generation == 3
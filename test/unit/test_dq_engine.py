@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cineflow.dq.engine import NotNullRule, RangeRule, UniqueRule, run_rules
+from cineflow.storage.staging import write_table
+
+
+def _ratings(tmp_path: Path) -> Path:
+    rng = np.random.default_rng(0)
+    n = 10_000
+    df = pd.DataFrame(
+        {
+            "userId": np.arange(n, dtype="int32"),
+            "movieId": rng.integers(1, 500, n).astype("int32"),
+            "rating": rng.integers(1, 6, n).astype("float32"),
+            "timestamp": np.arange(n, dtype="int64"),
+        }
+    )
+    df.loc[[10, 20], "rating"] = 7.0
+    df.loc[30, "rating"] = np.nan
+    # Tres filas repetidas, en lotes distintos y dentro del mismo lote
+    df = pd.concat([df, df.iloc[[5, 5, 9_999]]], ignore_index=True)
+    write_table(df, "ratings", tmp_path, "parquet")
+    return tmp_path
+
+
+def test_single_pass_counts(tmp_path: Path) -> None:
+    base = _ratings(tmp_path)
+    key = ["userId", "movieId", "timestamp"]
+    report = run_rules(
+        "ratings",
+        [RangeRule("rating", 0, 5), NotNullRule(["rating"]), UniqueRule(key)],
+        chunk_size=3_000,
+        base=base,
+    )
+    assert report.rows == 10_003 and report.chunks == 4
+    assert [r.violations for r in report.results] == [3, 1, 3]
+    assert not report.ok
+    assert report.to_dict()["rules"][2]["approximate"] is False
+
+
+def test_spilled_uniqueness_is_exact(tmp_path: Path) -> None:
+    base = _ratings(tmp_path)
+    rule = UniqueRule(["userId", "movieId", "timestamp"], expected_rows=10_003, memory_bytes=4096)
+    report = run_rules("ratings", [rule], chunk_size=3_000, base=base)
+    assert rule.mode == "spill"
+    assert report.results[0].violations == 3
+
+
+def test_bloom_uniqueness_is_upper_bound(tmp_path: Path) -> None:
+    base = _ratings(tmp_path)
+    rule = UniqueRule(["userId", "movieId", "timestamp"], expected_rows=10_003, fp_rate=0.001)
+    report = run_rules("ratings", [rule], chunk_size=3_000, base=base)
+    # Nunca cuenta menos que los repetidos reales; el exceso son falsos positivos
+    assert 3 <= report.results[0].violations < 50
+    assert report.results[0].approximate
+    assert rule.memory_bytes < 32_000
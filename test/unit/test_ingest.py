@@ -0,0 +1,14 @@
+import pandas as pd
+
+from cineflow.pipelines.ingest_raw import movie_hash
+
+
+def test_movie_hash_changes_only_with_content() -> None:
+    movies = pd.DataFrame(
+        {"movieId": [1, 2, 3], "title": ["A", "A", "B"], "genres": ["Drama", "Drama", None]}
+    )
+    edited = movies.assign(genres=["Drama", "Drama|War", None])
+    before, after = movie_hash(movies), movie_hash(edited)
+
+    assert before[0] == before[1] != before[2]  # no depende del movieId
+    assert list(before == after) == [True, False, True]
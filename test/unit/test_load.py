@@ -0,0 +1,10 @@
+from cineflow.pipelines.load_warehouse import split_range
+
+
+def test_split_range_covers_span_without_overlap() -> None:
+    ranges = split_range(100, 199, 3)
+    bounds = [(q["timestamp"]["$gte"], q["timestamp"]["$lt"]) for q in ranges]
+
+    assert bounds[0][0] == 100 and bounds[-1][1] == 200  # el último incluye hi
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+    assert len(split_range(5, 6, 8)) == 2  # no más tramos que segundos
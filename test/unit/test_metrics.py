@@ -0,0 +1,58 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from cineflow.utils import metrics
+
+
+def test_measure_counts_rows_and_sql_across_threads(tmp_path: Path) -> None:
+    metrics.install()
+    engine = create_engine("sqlite://")
+
+    def query() -> None:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    with metrics.measure("load") as m:
+        metrics.add_rows(rows_in=10, rows_out=4)
+        query()
+        with ThreadPoolExecutor(2) as pool:
+            for f in [pool.submit(metrics.propagate(query)) for _ in range(3)]:
+                f.result()
+    metrics.add_rows(rows_in=99)  # fuera de la etapa no cuenta
+
+    assert (m.rows_in, m.rows_out, m.status) == (10, 4, "ok")
+    assert m.roundtrips["postgres"] == 4 and m.bytes_sent["postgres"] == 4 * len("SELECT 1")
+    assert m.seconds > 0 and m.peak_rss_bytes > 0 and m.rss_scope == "process"
+
+    metrics.write(tmp_path / "run.jsonl", [m])
+    metrics.write(tmp_path / "run.prom", [m])
+    row = json.loads((tmp_path / "run.jsonl").read_text())
+    assert row["stage"] == "load" and row["postgres_roundtrips"] == 4
+    prom = (tmp_path / "run.prom").read_text()
+    assert 'cineflow_stage_rows_in{stage="load"} 10' in prom
+    assert 'cineflow_stage_db_roundtrips{stage="load",db="postgres"} 4' in prom
+    assert 'cineflow_stage_peak_rss_bytes{stage="load",scope="process"}' in prom
+    assert 'cineflow_stage_db_bytes_received{stage="load",db="mongo"} 0' in prom
+
+
+def test_trace_sql_after_failed_statement(capsys: pytest.CaptureFixture[str]) -> None:
+    metrics.install(trace_sql=True)
+    engine = create_engine("sqlite://")
+    try:
+        with metrics.measure("admin", isolated_rss=True) as m:
+            with engine.connect() as conn:
+                with pytest.raises(Exception):
+                    conn.execute(text("SELECT * FROM missing_table"))
+                conn.execute(text("SELECT 2"))
+                assert "cineflow_t0" not in conn.info  # sin inicios huérfanos por el fallo
+    finally:
+        metrics.install(trace_sql=False)
+
+    traced = [line for line in capsys.readouterr().out.splitlines() if "[sql" in line]
+    assert len(traced) == 1 and traced[0].endswith("SELECT 2")
+    assert m.rss_scope == ("stage" if sys.platform == "linux" else "process")
@@ -0,0 +1,45 @@
+from contextlib import nullcontext
+
+import pytest
+
+from cineflow.scheduler import RAN, Stage, order, run_dag
+
+
+def _stage(name: str, log: list[str], deps: tuple[str, ...] = (), fail: bool = False) -> Stage:
+    def run() -> None:
+        if fail:
+            raise RuntimeError(name)
+        log.append(name)
+
+    return Stage(name, name, run, deps=deps)
+
+
+def test_run_dag_respects_deps_and_blocks_after_failure() -> None:
+    log: list[str] = []
+    stages = [
+        _stage("load", log, deps=("ingest", "dq")),
+        _stage("ingest", log),
+        _stage("dq", log, deps=("missing",)),  # deps fuera del grafo se ignoran
+        _stage("views", log, deps=("load",)),
+    ]
+    assert run_dag(stages, lambda label: nullcontext()) == {
+        "ingest": RAN,
+        "dq": RAN,
+        "load": RAN,
+        "views": RAN,
+    }
+    assert log.index("load") > max(log.index("ingest"), log.index("dq"))
+    assert log[-1] == "views"
+
+    log.clear()
+    stages[1] = _stage("ingest", log, fail=True)
+    with pytest.raises(RuntimeError, match="ingest"):
+        run_dag(stages, lambda label: nullcontext())
+    assert log == ["dq"]
+
+
+def test_order_detects_cycles() -> None:
+    log: list[str] = []
+    assert order([_stage("b", log, deps=("a",)), _stage("a", log)]) == ["a", "b"]
+    with pytest.raises(ValueError, match="Ciclo"):
+        order([_stage("a", log, deps=("b",)), _stage("b", log, deps=("a",))])
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from cineflow.analytics.similarity import SimilarityIndex, neighbours_frame, rating_matrix
+
+
+def _ratings() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(1)
+    pairs = np.unique(rng.integers(0, [60, 25], size=(900, 2)), axis=0)
+    ratings = rng.integers(1, 11, len(pairs)).astype(np.float32) / 2
+    return pairs[:, 0].astype(np.int32) + 1, pairs[:, 1].astype(np.int32) + 100, ratings
+
+
+def test_blocked_top_k_matches_dense_adjusted_cosine() -> None:
+    users, movies, ratings = _ratings()
+    frame = neighbours_frame(users, movies, ratings, k=5, min_ratings=3, memory_mb=64)
+    # Bloques de una fila: mismo resultado
+    tiny = neighbours_frame(users, movies, ratings, k=5, min_ratings=3, memory_mb=0)
+    pd.testing.assert_frame_equal(frame, tiny)
+
+    x, ids = rating_matrix(users, movies, ratings, min_ratings=3)
+    dense = (x @ x.T).toarray()
+    np.fill_diagonal(dense, -np.inf)
+    for movie_id, group in frame.groupby("movie_id"):
+        row = dense[np.searchsorted(ids, movie_id)]
+        best = np.sort(row[row > 0])[::-1][:5]
+        assert group["rank"].tolist() == list(range(1, len(group) + 1))
+        np.testing.assert_allclose(group["similarity"], best[: len(group)], atol=1e-4)
+        assert movie_id not in group["neighbor_id"].tolist()
+
+
+def test_similarity_index_lookup() -> None:
+    movies = pd.DataFrame(
+        {"movie_id": [3, 1, 2], "title": ["C", "A", "B"], "genres": ["War", "Drama", "Comedy"]}
+    )
+    neighbours = pd.DataFrame(
+        {"movie_id": [1, 1, 2, 9], "neighbor_id": [3, 2, 1, 1], "similarity": [0.9, 0.5, 0.7, 1.0]}
+    )
+    index = SimilarityIndex.from_frames(movies, neighbours, generation=2)
+    assert index.similar(1, 10) == [
+        {"movie_id": 3, "title": "C", "genres": "War", "similarity": 0.9},
+        {"movie_id": 2, "title": "B", "genres": "Comedy", "similarity": 0.5},
+    ]
+    assert [r["movie_id"] for r in index.similar(1, 1) or []] == [3]
+    assert index.similar(3, 10) == []
+    assert index.similar(9, 10) is None  # no está en dim_movie
@@ -0,0 +1,40 @@
+from pathlib import Path
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+from cineflow.bench import compare
+from cineflow.tools import synth
+
+
+def test_parse_scale() -> None:
+    assert synth.parse_scale("100K") == 100_000
+    assert synth.parse_scale("2.5m") == 2_500_000
+    assert synth.parse_scale(42) == 42
+    with pytest.raises(ValueError):
+        synth.parse_scale("10X")
+
+
+def test_generate_is_deterministic_and_skewed(tmp_path: Path) -> None:
+    dims = synth.Dims.for_scale(50_000, seed=7)
+    synth.generate(dims, tmp_path / "a")
+    synth.generate(dims, tmp_path / "b")
+    a = pq.read_table(tmp_path / "a" / "ratings.parquet").to_pandas()
+    b = pq.read_table(tmp_path / "b" / "ratings.parquet").to_pandas()
+    assert a.equals(b) and len(a) == 50_000
+    assert synth.is_current(tmp_path / "a", dims, "parquet")
+    assert not synth.is_current(tmp_path / "a", synth.Dims.for_scale(50_000, seed=8), "parquet")
+
+    assert not a.duplicated(["userId", "movieId", "timestamp"]).any()
+    assert a["rating"].between(0.5, 5.0).all()
+    assert a["movieId"].max() <= dims.movies and a["userId"].max() <= dims.users
+    # Cola larga: el 10 % de películas más vistas acumula la mayoría de ratings
+    counts = np.sort(a["movieId"].value_counts().to_numpy())[::-1]
+    assert counts[: dims.movies // 10].sum() > 0.5 * len(a)
+
+
+def test_compare_flags_regressions() -> None:
+    base = {"stages": {"load": {"seconds": 10.0, "postgres_roundtrips": 60}}}
+    now = {"stages": {"load": {"seconds": 13.0, "postgres_roundtrips": 61}, "new": {}}}
+    assert compare(base, now, threshold=0.2) == ["load.seconds +30%"]
@@ -0,0 +1,68 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from cineflow.analytics.time_index import MovieIndex, top_n
+
+
+def _index() -> MovieIndex:
+    cells = pd.DataFrame(
+        [
+            # movie_id, rating_date, ratings, rating_sum
+            (1, date(1997, 1, 1), 2, 9.0),
+            (1, date(1997, 3, 1), 1, 2.0),
+            (1, date(1998, 1, 1), 1, 5.0),
+            (2, date(1997, 6, 1), 3, 12.0),
+            (3, date(1998, 2, 1), 2, 10.0),
+        ],
+        columns=["movie_id", "rating_date", "ratings", "rating_sum"],
+    )
+    movies = pd.DataFrame(
+        {"movie_id": [3, 1, 2], "title": ["C", "A", "B"], "genres": ["War", "Drama", "Comedy"]}
+    )
+    genres = pd.DataFrame({"movie_id": [1, 2, 3], "genre": ["Drama", "Comedy", "War"]})
+    return MovieIndex.from_frames(cells, movies, genres, generation=7)
+
+
+def test_totals_over_closed_windows() -> None:
+    index = _index().index
+    cnt, total = index.totals()
+    assert cnt.tolist() == [4, 3, 2] and total.tolist() == [16.0, 12.0, 10.0]
+    cnt, total = index.totals(date(1997, 3, 1), date(1997, 12, 31))
+    assert cnt.tolist() == [1, 3, 0] and total.tolist() == [2.0, 12.0, 0.0]
+    assert index.totals(date(1998, 1, 1), date(1998, 1, 1))[0].tolist() == [1, 0, 0]
+    # until < since: ventana vacía
+    assert index.totals(date(1998, 1, 1), date(1997, 1, 1))[0].tolist() == [0, 0, 0]
+
+
+def test_top_movies_with_window_and_genre() -> None:
+    index = _index()
+    top = index.top_movies(limit=2, min_votes=1, until=date(1997, 12, 31))
+    assert [(r["movie_id"], r["ratings"], r["avg_rating"]) for r in top] == [
+        (2, 3, Decimal("4.00")),
+        (1, 3, Decimal("3.67")),
+    ]
+    drama = index.top_movies(limit=5, min_votes=1, since=date(1997, 2, 1), genre="drama")
+    assert drama == [
+        {
+            "movie_id": 1,
+            "title": "A",
+            "genres": "Drama",
+            "ratings": 2,
+            "avg_rating": Decimal("3.50"),
+        }
+    ]
+    assert index.top_movies(limit=5, min_votes=1, genre="Western") == []
+
+
+def test_top_n_matches_full_sort() -> None:
+    rng = np.random.default_rng(0)
+    cnt = rng.integers(0, 20, 500)
+    total = cnt * rng.choice([3.0, 3.5, 4.0], 500)
+    idx, avg = top_n(cnt, total, limit=25, min_votes=5)
+    keep = np.flatnonzero(cnt >= 5)
+    full = np.lexsort((keep, -cnt[keep], -np.round(total[keep] / cnt[keep], 2)))[:25]
+    assert idx.tolist() == keep[full].tolist()
+    assert (avg == np.round(total[idx] / cnt[idx], 2)).all()